@@ -22,7 +22,7 @@ const ImageGallery: React.FC = () => {
       {/* Relocation Plan (Interactive Pyvis Graph) */}
       <h3>Relocation Plan</h3>
       <iframe
-        src="http://127.0.0.1:5000/relocation"
+        src="http://127.0.0.1:5000/relocation/latest/html"
         title="Relocation Plan"
         width="800"
         height="600"
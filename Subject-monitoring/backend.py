@@ -4,8 +4,24 @@ import flask
 from flask import request
 from terra.base_client import Terra
 import os
+import sys
+import threading
 from dotenv import load_dotenv
 import datetime
+from collections import defaultdict
+
+import numpy as np
+
+# squad monitoring modules live at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from heart_metrics import OnlineHRV, detect_peaks
+import instrumentation
+from instrumentation import observe, profiler, render, set_gauge, timer
+from timeseries_store import SampleStore
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from backfill_cache import BackfillCache
+from ingest import WebhookIngestor, parse_payload
 
 # Load environment variables from .env file
 load_dotenv()
@@ -34,8 +50,87 @@ api_key = os.getenv("API_KEY")
 
 terra = Terra(api_key=api_key, dev_id=dev_id, secret=webhook_secret)
 
+# running HRV estimates per Terra user, updated on every webhook (last 300 intervals). Beat-to-beat
+# intervals come from peaks in the raw green PPG channel; users that only send Terra's averaged
+# bpm samples get a heart rate from those, but no SDNN / RMSSD
+hrv_tracker = OnlineHRV(window=300)
+bpm_tracker = OnlineHRV(window=300)
+hrv_lock = threading.Lock()
+
+# sample rate of the raw wearable channels (Hz)
+SAMPLE_RATE = 25
+# stored green samples re-read before each new chunk, so peaks on the chunk boundary are found
+PEAK_CONTEXT = 2 * SAMPLE_RATE
+# user_id -> sample index of the last green peak passed to hrv_tracker
+last_peak_sample = {}
+
+# on-disk per-soldier, per-channel samples feeding SquadMonitor
+samples = SampleStore(os.getenv("SAMPLE_STORE_DIR", "sample_store"))
+
+# past days of Terra activity are fetched once and then served from disk
+backfill_cache = BackfillCache(terra, os.getenv("BACKFILL_CACHE_DIR", "backfill_cache"))
+
+
+def green_peak_times(user_id, green):
+    # times (s, on the user's green sample clock) of the peaks in a new chunk, before it is stored
+    offset = samples.length(user_id, "green")
+    context = samples.read(user_id, "green", max(0, offset - PEAK_CONTEXT), offset)
+    signal = np.concatenate([context, green])
+    _, peaks = detect_peaks(signal[None, :], [len(signal)])
+    peaks = peaks + (offset - len(context))
+    # peaks in the context that were already confirmed by the previous chunk are skipped
+    peaks = peaks[peaks > last_peak_sample.get(user_id, -1)]
+    if len(peaks):
+        last_peak_sample[user_id] = int(peaks[-1])
+    return peaks / SAMPLE_RATE
+
+
+def process_webhooks(bodies):
+    peak_users, peak_times = [], []
+    bpm_users, bpm_rr = [], []
+    for body in bodies:
+        user_id, channels, timestamps = parse_payload(body)
+        _LOGGER.debug("Processing Terra %s webhook for %s", body.get("type"), user_id)
+        if not user_id or not channels:
+            continue
+        if "green" in channels:
+            times = green_peak_times(user_id, channels["green"])
+            peak_users.extend([user_id] * len(times))
+            peak_times.extend(times)
+        elif "bpm" in channels:
+            # averaged heart rate only: good for a heart rate estimate, not for beat-to-beat HRV
+            bpm_users.extend([user_id] * len(channels["bpm"]))
+            bpm_rr.extend(60.0 / channels["bpm"])
+        # stored with the measurement time of each channel's first sample, not the arrival time
+        by_time = defaultdict(dict)
+        for name, values in channels.items():
+            by_time[timestamps.get(name)][name] = values
+        for timestamp, group in by_time.items():
+            samples.append(user_id, group, timestamp=timestamp)
+    observe("squad_batch_size", len(bodies), stage="webhook_batch")
+    with hrv_lock:
+        if peak_times:
+            hrv_tracker.add_peaks(peak_users, peak_times)
+        if bpm_rr:
+            bpm_tracker.add_intervals(bpm_users, bpm_rr)
+
+
+# webhooks are acknowledged right after verification and processed in batches by worker threads;
+# each user's webhooks always go to the same worker, so their samples and RR intervals stay in order
+ingestor = WebhookIngestor(process_webhooks, maxsize=1000, num_workers=2)
+ingestor.start()
+
+if os.getenv("SQUAD_PROFILE", "0") == "1":
+    profiler.start()
+
+
 @app.route("/ConsumeTerraWebhook", methods=['POST'])
 def consume_terra_webhook():
+    with timer("http_request_seconds", route="webhook"):
+        return handle_webhook()
+
+
+def handle_webhook():
     body = request.get_json()
 
 
@@ -45,12 +140,55 @@ def consume_terra_webhook():
         _LOGGER.info('NO')
         return flask.Response(status=403)
 
-
-    _LOGGER.info("Recieved Terra Webhook: %s",  body)
+    set_gauge("queue_depth", ingestor.depth(), queue="webhook")
+    if not ingestor.submit(body):
+        # queue is full: ask Terra to retry instead of doing the work inline
+        _LOGGER.warning("Webhook queue full (%d pending), rejecting", ingestor.depth())
+        return flask.Response(status=429, headers={"Retry-After": "1"})
 
     return flask.Response(status=200)
 
 
+@app.route('/metrics', methods=['GET', 'POST'])
+def metrics():
+    # Prometheus text exposition; recording is off unless SQUAD_METRICS=1 or it is switched on
+    # at runtime with POST /metrics?enabled=1 (and off again with enabled=0)
+    if request.method == 'POST':
+        enabled = request.args.get("enabled", "1") == "1"
+        instrumentation.enable() if enabled else instrumentation.disable()
+        return flask.jsonify({"enabled": enabled})
+    return flask.Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/profile', methods=['GET', 'POST'])
+def profile():
+    # collapsed stacks from the sampling profiler; it starts with SQUAD_PROFILE=1 or at runtime with
+    # POST /profile?enabled=1, and POST /profile?enabled=0 stops it and discards the samples
+    if request.method == 'POST':
+        enabled = request.args.get("enabled", "1") == "1"
+        if enabled:
+            profiler.start()
+        else:
+            profiler.stop()
+            profiler.clear()
+        return flask.jsonify({"enabled": enabled})
+    if not profiler.is_running():
+        return flask.Response(status=404)
+    return flask.Response(profiler.collapsed(), mimetype="text/plain")
+
+
+@app.route('/hrv/<user_id>', methods=['GET'])
+def hrv(user_id):
+    with hrv_lock:
+        if user_id in hrv_tracker.rows:
+            metrics = hrv_tracker.metrics([user_id])
+            return flask.jsonify({"source": "ppg", **{name: float(metrics[name][0]) for name in ["heart_rate", "mean_rr", "sdnn", "rmssd"]}})
+        if user_id in bpm_tracker.rows:
+            metrics = bpm_tracker.metrics([user_id])
+            return flask.jsonify({"source": "bpm", "heart_rate": float(metrics["heart_rate"][0]), "mean_rr": None, "sdnn": None, "rmssd": None})
+    return flask.Response(status=404)
+
+
 @app.route('/authenticate', methods=['GET'])
 def authenticate():
     widget_response=terra.generate_widget_session(providers=[], reference_id='1234')
@@ -64,11 +202,11 @@ def backfill():
 
     user_id = "12b5f134-a04b-4151-8812-6528982d23da"
 
-    terra_user = terra.from_user_id(user_id)
-
-    heart_data = terra_user.get_activity(start_date=datetime.datetime.now() - datetime.timedelta(days=7), end_date=datetime.datetime.now())  
+    now = datetime.datetime.now()
+    with timer("http_request_seconds", route="backfill"):
+        heart_data = backfill_cache.get_activity(user_id, now - datetime.timedelta(days=7), now)
 
-    return heart_data.get_json()
+    return flask.jsonify(heart_data)
 
 if __name__ == "__main__":
     app.run()
\ No newline at end of file
@@ -1,13 +1,24 @@
-from flask import Flask, jsonify, send_file
+from flask import Flask, jsonify, redirect, request, send_file
+import hashlib
 import json
 import os
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend to avoid Tkinter issues
-import matplotlib.pyplot as plt
-import networkx as nx
-from pyvis.network import Network
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from flask_cors import CORS
 
+# squad monitoring modules live at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from relocation import plan_relocation
+from spatial_index import SpatialIndex
+
+# and the chart renderer next to this file
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from relocation_render import render_relocation
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS to allow requests from frontend
 
@@ -15,111 +26,251 @@ CORS(app)  # Enable CORS to allow requests from frontend
 static_dir = os.path.join(os.getcwd(), "static")
 os.makedirs(static_dir, exist_ok=True)
 
-graph_data = json.load(open("graph_data.json", "r"))
-
-location_target = (2, 3)
-threshold = 0.9
-
-target_soldiers = {p: d for p, d in graph_data.items() if tuple(d["location"]) == location_target}
-below_threshold = {p for p, d in target_soldiers.items() if d["health"] < threshold}
-
-healthy_soldiers = {p: d for p, d in graph_data.items() if d["health"] >= threshold and tuple(d["location"]) != location_target}
-
-def distance(loc1, loc2):
-    return (loc1[0] - loc2[0]) ** 2 + (loc1[1] - loc2[1]) ** 2
-
-# Greedy algorithm which minimizes the distance that you would have to move healthy troops from other locations to get them to be at location_target
-# The output should be a list of tuples (person_a, person_b), where person_a is the person to be replaced, and person_b is the person replacing them. 
-total_cost = 0
-relocation_plan = []
-for soldier in below_threshold:
-    if not healthy_soldiers:
-        break  # No more healthy soldiers to move
-    
-    # Find the closest healthy soldier
-    closest_replacement = min(healthy_soldiers, key=lambda s: distance(tuple(healthy_soldiers[s]["location"]), location_target))
-    total_cost += distance(tuple(healthy_soldiers[closest_replacement]["location"]), location_target)
-    
-    # Record the move
-    relocation_plan.append((soldier, closest_replacement))
-    
-    # Remove the moved soldier from available replacements
-    del healthy_soldiers[closest_replacement]
-
-# Output the final relocation plan
-print(relocation_plan)
-print(total_cost)
-
-locations = {tuple(d["location"]) for d in graph_data.values()}
-donor_locations = {tuple(graph_data[p]["location"]) for _, p in relocation_plan}
-# Assign colors based on role
-colors = {}
-for loc in locations:
-    if loc == location_target:
-        colors[loc] = "green"  # Target location
-    elif loc in donor_locations:
-        colors[loc] = "red"    # Donor locations
-    else:
-        colors[loc] = "blue"   # Other locations
-
-# Plot locations
-plt.figure(figsize=(8, 6))
-for loc, color in colors.items():
-    plt.scatter(loc[0], loc[1], color=color, s=200, edgecolors="black", label=color if color not in plt.gca().get_legend_handles_labels()[1] else "")
-
-# Labels and aesthetics
-plt.xlabel("X Coordinate")
-plt.ylabel("Y Coordinate")
-plt.title("Soldier Relocation Visualization")
-plt.legend(["Target (Green)", "Donor (Red)", "Neutral (Blue)"])
-plt.grid(True)
-plt.show()
-
-# Create NetworkX graph
-G = nx.Graph()
-
-# Add nodes with colors
-for loc in locations:
-    G.add_node(loc, color=colors[loc])
-
-# Add edges for relocations
-edges = []
-edge_labels = {}
-for donor, receiver in relocation_plan:
-    donor_loc = tuple(graph_data[donor]["location"])
-    target_loc = tuple(graph_data[receiver]["location"])
-
-    # Ensure the order of the tuple is consistent: donor -> receiver
-    edge_tuple = (donor_loc, target_loc) if donor_loc < target_loc else (target_loc, donor_loc)
-    
-    G.add_edge(donor_loc, target_loc)
-    edges.append((donor_loc, target_loc))
-    edge_labels[edge_tuple] = edge_labels.get(edge_tuple, "") + f"{donor} → {receiver} "
-
-# --- Matplotlib Visualization ---
-plt.figure(figsize=(8, 6))
-pos = {loc: loc for loc in locations}  # Position nodes based on coordinates
-node_colors = [colors[n] for n in G.nodes]
-
-nx.draw(G, pos, with_labels=True, node_color=node_colors, edge_color="black", node_size=1000, font_size=8, font_weight="bold")
-nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=7, font_color="red")
-
-plt.title("Relocation Graph with Transfers")
-plt.show()
-
-# --- Pyvis (Interactive Web Visualization) ---
-nt = Network('500px', '500px', notebook=True)
-for node in G.nodes:
-    node_id = str(node)  # Convert the tuple to a string
-    nt.add_node(node_id, color=colors[node], title=str(node))  # Add tooltips
-
-# Then, when adding edges to the graph, make sure the correct order is followed:
-for edge in G.edges:
-    edge_tuple = (edge[0], edge[1]) if edge[0] < edge[1] else (edge[1], edge[0])
-    label = edge_labels.get(edge_tuple, "")
-    nt.add_edge(str(edge[0]), str(edge[1]), title=label)  # Ensure edge ordering
-
-nt.show("nx.html")
+graph_data_path = os.path.join(os.getcwd(), "graph_data.json")
+
+default_location_target = (2, 3)
+default_threshold = 0.9
+
+
+class TTLCache:
+    # LRU cache whose entries also expire after ttl seconds
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+plan_cache = TTLCache()
+
+# charts are rendered off the request thread; artifacts are content-addressed by plan
+render_pool = ProcessPoolExecutor(max_workers=2)
+render_jobs = {}  # artifact id -> Future, dropped once the render has written its files
+render_lock = threading.RLock()
+latest_artifact = {"id": None}  # most recently finished render, served by /plot and /network
+artifact_kinds = {"plot": ("plot-{}.png", "image/png"),
+                  "graph": ("relocation-{}.png", "image/png"),
+                  "html": ("relocation-{}.html", "text/html")}
+# rendered artifacts kept in static/, oldest deleted first; every distinct plan writes a new set
+max_artifacts = int(os.getenv("MAX_RELOCATION_ARTIFACTS", "64"))
+# any file written for an artifact, including temporary files left by an interrupted render
+artifact_file = re.compile(r"^(?:plot|relocation)-([0-9a-f]{20})\.")
+# committed charts served while the first render of a fresh server is still running
+placeholders = {"plot": "plot.png", "graph": "relocation.png", "html": "relocation.html"}
+
+# graph_data is reloaded only when the file on disk changes
+graph_state = {"stat": None, "hash": None, "data": None, "index": None}
+graph_lock = threading.Lock()
+
+
+def load_graph_data():
+    stat = os.stat(graph_data_path)
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    with graph_lock:
+        if graph_state["stat"] != stat_key:
+            with open(graph_data_path, "rb") as f:
+                raw = f.read()
+            data_hash = hashlib.sha256(raw).hexdigest()
+            if data_hash != graph_state["hash"]:
+                graph_state["data"] = json.loads(raw)
+                graph_state["index"] = SpatialIndex(graph_state["data"])
+                graph_state["hash"] = data_hash
+                plan_cache.clear()
+            graph_state["stat"] = stat_key
+        return graph_state["data"], graph_state["index"], graph_state["hash"]
+
+
+def compute_plan(location_target, threshold):
+    graph_data, spatial_index, data_hash = load_graph_data()
+    key = (data_hash, location_target, threshold)
+    plan = plan_cache.get(key)
+    if plan is None:
+        relocation_plan, total_cost = plan_relocation(graph_data, location_target, threshold, index=spatial_index)
+        plan = {"relocation_plan": relocation_plan, "total_cost": total_cost, "data_hash": data_hash}
+        plan["artifact"] = hashlib.sha256(json.dumps([data_hash, location_target, threshold, relocation_plan]).encode()).hexdigest()[:20]
+        plan_cache.put(key, plan)
+    return graph_data, plan
+
+
+def artifact_path(artifact, kind):
+    return os.path.join(static_dir, artifact_kinds[kind][0].format(artifact))
+
+
+def artifact_exists(artifact):
+    return all(os.path.exists(artifact_path(artifact, kind)) for kind in artifact_kinds)
+
+
+def artifact_status(artifact):
+    if artifact_exists(artifact):
+        return "done"
+    with render_lock:
+        job = render_jobs.get(artifact)
+    if job is None:
+        # the job may have finished (and been dropped) since the first check
+        return "done" if artifact_exists(artifact) else "missing"
+    if not job.done():
+        return "pending"
+    if job.exception() is not None:
+        return "failed"
+    return "done"
+
+
+def prune_artifacts():
+    # keep the newest max_artifacts renders in static/; the latest one and those still rendering stay
+    groups = {}
+    for name in os.listdir(static_dir):
+        match = artifact_file.match(name)
+        if match:
+            path = os.path.join(static_dir, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            files, newest = groups.get(match.group(1), ([], 0))
+            groups[match.group(1)] = (files + [path], max(newest, mtime))
+    with render_lock:
+        keep = set(render_jobs) | {latest_artifact["id"]}
+    stale = sorted((newest, artifact) for artifact, (_, newest) in groups.items() if artifact not in keep)
+    for _, artifact in stale[:max(0, len(groups) - max_artifacts)]:
+        for path in groups[artifact][0]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def render_finished(artifact, job):
+    # successful jobs are forgotten once their files exist; failures are kept to report the error
+    # until the plan is rendered again
+    with render_lock:
+        if job.exception() is None:
+            latest_artifact["id"] = artifact
+            if render_jobs.get(artifact) is job:
+                del render_jobs[artifact]
+    prune_artifacts()
+
+
+def submit_render(graph_data, location_target, plan):
+    artifact = plan["artifact"]
+    with render_lock:
+        job = render_jobs.get(artifact)
+        if job is not None and not (job.done() and job.exception() is not None):
+            return artifact
+        if artifact_exists(artifact):
+            latest_artifact["id"] = artifact
+            render_jobs.pop(artifact, None)
+            return artifact
+        job = render_jobs[artifact] = render_pool.submit(
+            render_relocation, graph_data, location_target, plan["relocation_plan"],
+            artifact_path(artifact, "plot"), artifact_path(artifact, "graph"), artifact_path(artifact, "html"))
+    job.add_done_callback(lambda job: render_finished(artifact, job))
+    return artifact
+
+
+def artifact_response(artifact):
+    status = artifact_status(artifact)
+    body = {"artifact": artifact, "status": status}
+    if status == "done":
+        body["urls"] = {kind: f"/relocation/artifacts/{artifact}/{kind}" for kind in artifact_kinds}
+    elif status == "failed":
+        body["error"] = str(render_jobs[artifact].exception())
+    return jsonify(body), {"done": 200, "pending": 202, "missing": 404, "failed": 500}[status]
+
+
+def plan_arguments():
+    location_target = (request.args.get("x", default_location_target[0], type=float),
+                       request.args.get("y", default_location_target[1], type=float))
+    # keep integer grid coordinates as ints so they match the locations in graph_data
+    location_target = tuple(int(v) if float(v).is_integer() else v for v in location_target)
+    threshold = request.args.get("threshold", default_threshold, type=float)
+    return location_target, threshold
+
+
+@app.route("/relocation", methods=["GET"])
+def relocation():
+    location_target, threshold = plan_arguments()
+    _, plan = compute_plan(location_target, threshold)
+    return jsonify(plan)
+
+
+@app.route("/relocation/render", methods=["GET", "POST"])
+def relocation_render():
+    # start rendering the charts for a plan in the background and return the artifact id to poll
+    location_target, threshold = plan_arguments()
+    graph_data, plan = compute_plan(location_target, threshold)
+    artifact = submit_render(graph_data, location_target, plan)
+    return artifact_response(artifact)
+
+
+@app.route("/relocation/latest/<kind>", methods=["GET"])
+def relocation_latest(kind):
+    # redirect to the most recently finished render. On a fresh server the default plan is queued
+    # for rendering and, without waiting for it, the committed chart in static/ is served as a
+    # placeholder (or the 202 render status when there is none)
+    if kind not in artifact_kinds:
+        return jsonify({"error": f"unknown artifact kind {kind}"}), 404
+    with render_lock:
+        artifact = latest_artifact["id"]
+    if artifact is None or not artifact_exists(artifact):
+        graph_data, plan = compute_plan(default_location_target, default_threshold)
+        artifact = submit_render(graph_data, default_location_target, plan)
+        if artifact_status(artifact) != "done":
+            placeholder = os.path.join(static_dir, placeholders[kind])
+            if not os.path.exists(placeholder):
+                return artifact_response(artifact)
+            response = send_file(placeholder, mimetype=artifact_kinds[kind][1])
+            response.headers["Cache-Control"] = "no-store"
+            return response
+    return redirect(f"/relocation/artifacts/{artifact}/{kind}")
+
+
+# routes loaded by the dashboard (app/components/ImageGallery.tsx)
+@app.route("/plot", methods=["GET"])
+def plot():
+    return relocation_latest("plot")
+
+
+@app.route("/network", methods=["GET"])
+def network():
+    return relocation_latest("graph")
+
+
+@app.route("/relocation/artifacts/<artifact>", methods=["GET"])
+def relocation_artifact_status(artifact):
+    return artifact_response(artifact)
+
+
+@app.route("/relocation/artifacts/<artifact>/<kind>", methods=["GET"])
+def relocation_artifact(artifact, kind):
+    if kind not in artifact_kinds:
+        return jsonify({"error": f"unknown artifact kind {kind}"}), 404
+    if artifact_status(artifact) != "done":
+        return artifact_response(artifact)
+    return send_file(artifact_path(artifact, kind), mimetype=artifact_kinds[kind][1])
+
 
 if __name__ == "__main__":
     app.run(port=5000, debug=True, use_reloader=False)
@@ -0,0 +1,135 @@
+import datetime
+import json
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+
+
+class BackfillCache:
+    # Read-through cache for Terra activity backfills, bucketed by (user, day).
+    # Each bucket is stored with the time it was fetched. A day is served from memory or from the
+    # JSON files under cache_dir only if it was fetched at least `settle` after the day ended
+    # (wearables sync late); anything fetched earlier, including the current day, is fetched again.
+    # Contiguous days that need fetching are merged into one request. At most max_entries day
+    # buckets are kept; the least recently used ones are evicted from memory and disk.
+    # `client` is anything with Terra's from_user_id(user_id).get_activity(...) interface and `now`
+    # a clock returning a naive datetime, so tests can pass a local stub and a fixed time.
+    def __init__(self, client, cache_dir="backfill_cache", max_entries=4096, settle=datetime.timedelta(hours=6), now=None):
+        self.client = client
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.settle = settle
+        self.now = now or datetime.datetime.now
+        self.entries = OrderedDict()  # (user_id, day) -> (records, fetched_at), or None if only on disk
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_existing()
+
+    def _path(self, user_id, day):
+        return os.path.join(self.cache_dir, quote(user_id, safe=""), f"{day.isoformat()}.json")
+
+    def _load_existing(self):
+        # register buckets already on disk, oldest first, so eviction order survives restarts.
+        # Anything else (a .tmp file left by an interrupted write, stray files) is deleted.
+        found = []
+        for user_dir in os.listdir(self.cache_dir):
+            user_path = os.path.join(self.cache_dir, user_dir)
+            if not os.path.isdir(user_path):
+                continue
+            for name in os.listdir(user_path):
+                path = os.path.join(user_path, name)
+                try:
+                    day = datetime.date.fromisoformat(name[:-len(".json")]) if name.endswith(".json") else None
+                except ValueError:
+                    day = None
+                if day is None:
+                    if os.path.isfile(path):
+                        os.remove(path)
+                    continue
+                found.append((os.path.getmtime(path), user_dir, day))
+        for _, user_dir, day in sorted(found):
+            self.entries[(unquote(user_dir), day)] = None
+        self._evict()
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            (user_id, day), _ = self.entries.popitem(last=False)
+            try:
+                os.remove(self._path(user_id, day))
+            except FileNotFoundError:
+                pass
+
+    def _get(self, user_id, day):
+        key = (user_id, day)
+        if key not in self.entries:
+            return None
+        entry = self.entries[key]
+        if entry is None:
+            with open(self._path(user_id, day)) as f:
+                stored = json.load(f)
+            # files without a fetch time are treated as never settled and fetched again
+            fetched_at = stored.get("fetched_at") if isinstance(stored, dict) else None
+            entry = (stored["data"] if isinstance(stored, dict) else stored,
+                     datetime.datetime.fromisoformat(fetched_at) if fetched_at else None)
+            self.entries[key] = entry
+        self.entries.move_to_end(key)
+        return entry
+
+    def _put(self, user_id, day, records, fetched_at):
+        path = self._path(user_id, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"fetched_at": fetched_at.isoformat(), "data": records}, f)
+        os.replace(tmp, path)
+        self.entries[(user_id, day)] = (records, fetched_at)
+        self.entries.move_to_end((user_id, day))
+
+    def _settled_at(self, day):
+        # earliest fetch time after which a day's bucket is final
+        return datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min) + self.settle
+
+    def _fetch(self, user_id, first_day, last_day):
+        # one remote call for a contiguous run of days, split back into day buckets
+        start = datetime.datetime.combine(first_day, datetime.time.min)
+        end = datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time.min)
+        response = self.client.from_user_id(user_id).get_activity(start_date=start, end_date=end, to_webhook=False)
+        buckets = {first_day + datetime.timedelta(days=i): [] for i in range((last_day - first_day).days + 1)}
+        for record in (response.get_json() or {}).get("data") or []:
+            day = datetime.date.fromisoformat(record["metadata"]["start_time"][:10])
+            if day in buckets:
+                buckets[day].append(record)
+        return buckets
+
+    def get_activity(self, user_id, start_date, end_date):
+        first_day, last_day = start_date.date(), end_date.date()
+        days = [first_day + datetime.timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+        now = self.now()
+        with self.lock:
+            records = {}
+            for day in days:
+                if self._settled_at(day) > now:
+                    continue
+                entry = self._get(user_id, day)
+                if entry is not None and entry[1] is not None and entry[1] >= self._settled_at(day):
+                    records[day] = entry[0]
+            missing = [day for day in days if day not in records]
+            # merge consecutive missing days into ranges
+            runs = []
+            for day in missing:
+                if runs and day - runs[-1][1] == datetime.timedelta(days=1):
+                    runs[-1][1] = day
+                else:
+                    runs.append([day, day])
+        for run_start, run_end in runs:
+            # stamped before the request, so records arriving during it are not assumed included
+            fetched_at = self.now()
+            fetched = self._fetch(user_id, run_start, run_end)
+            with self.lock:
+                for day, day_records in fetched.items():
+                    self._put(user_id, day, day_records, fetched_at)
+                    records[day] = day_records
+                self._evict()
+        return {"user": {"user_id": user_id}, "type": "activity",
+                "data": [record for day in days for record in records.get(day) or []]}
@@ -0,0 +1,72 @@
+import argparse
+import datetime
+import hashlib
+import hmac
+import json
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Local stand-in for Terra: sends signed activity webhooks with heart rate samples and raw
+# wearable channels to the /ConsumeTerraWebhook endpoint, optionally in bursts.
+
+webhook_secret = "53c98e6ad3ee15ca47f3d8fa0a38d64290f7ef82e0e73881"
+
+
+def make_payload(user_id, rng, num_hr=60, num_raw=250, sample_rate=25):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    hr_samples = [{"timestamp": (now + datetime.timedelta(seconds=i)).isoformat(), "bpm": float(rng.normal(75, 5))}
+                  for i in range(num_hr)]
+    t = np.arange(num_raw) / sample_rate
+    samples = {
+        "green": np.sin(2 * np.pi * 1.25 * t).tolist(),
+        "red": rng.normal(size=num_raw).tolist(),
+        "IR": rng.normal(size=num_raw).tolist(),
+        "acc_x": rng.normal(size=num_raw).tolist(),
+        "acc_y": rng.normal(size=num_raw).tolist(),
+        "acc_z": rng.normal(1, 0.1, size=num_raw).tolist(),
+    }
+    return {
+        "type": "activity",
+        "user": {"user_id": user_id, "provider": "FAKE"},
+        "data": [{"metadata": {"start_time": now.isoformat()},
+                  "heart_data": {"heart_rate_data": {"detailed": {"hr_samples": hr_samples}}}, "samples": samples}],
+    }
+
+
+def sign(body, secret=webhook_secret):
+    t = str(int(time.time()))
+    signature = hmac.new(secret.encode("utf-8"), msg=f"{t}.{body}".encode("utf-8"), digestmod=hashlib.sha256).hexdigest()
+    return f"t={t},v1={signature}"
+
+
+def send(url, payload):
+    body = json.dumps(payload)
+    req = urllib.request.Request(url, data=body.encode("utf-8"), method="POST",
+                                 headers={"Content-Type": "application/json", "terra-signature": sign(body)})
+    try:
+        with urllib.request.urlopen(req) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:5000/ConsumeTerraWebhook")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--count", type=int, default=100, help="webhooks to send")
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    payloads = [make_payload(f"fake-user-{i % args.users}", rng) for i in range(args.count)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        statuses = Counter(pool.map(lambda payload: send(args.url, payload), payloads))
+    elapsed = time.perf_counter() - start
+    print(f"sent {args.count} webhooks in {elapsed:.2f}s: {dict(statuses)}")
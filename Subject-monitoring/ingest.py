@@ -0,0 +1,129 @@
+import datetime
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+_LOGGER = logging.getLogger("app.ingest")
+
+# raw wearable channels consumed by SquadMonitor
+SIGNAL_CHANNELS = ["green", "red", "IR", "acc_x", "acc_y", "acc_z"]
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def payload_user_id(body):
+    return (body.get("user") or {}).get("user_id")
+
+
+def timestamp_ns(value):
+    # ISO 8601 time from a Terra payload -> ns since epoch (UTC when no offset is given), None if unparseable
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return (moment - EPOCH) // datetime.timedelta(microseconds=1) * 1000
+
+
+def parse_payload(body):
+    # Terra webhook body -> (user_id, {channel: 1-D array}, {channel: first-sample time in ns})
+    # heart rate comes from Terra's hr_samples; raw PPG / accelerometer channels are read from a
+    # "samples" block when the sender includes one (our wearable bridge and fake_webhook.py do).
+    # bpm is timed by its first hr_sample, raw channels by the entry's metadata start_time
+    # (falling back to the first hr_sample); channels without a usable time are left out.
+    user_id = payload_user_id(body)
+    channels = defaultdict(list)
+    timestamps = {}
+    for entry in body.get("data") or []:
+        detailed = ((entry.get("heart_data") or {}).get("heart_rate_data") or {}).get("detailed") or {}
+        samples = sorted(detailed.get("hr_samples") or [], key=lambda sample: sample.get("timestamp", ""))
+        samples = [sample for sample in samples if sample.get("bpm")]
+        first_sample = timestamp_ns(samples[0].get("timestamp")) if samples else None
+        if samples and "bpm" not in timestamps and first_sample is not None:
+            timestamps["bpm"] = first_sample
+        channels["bpm"].extend(sample["bpm"] for sample in samples)
+        raw = entry.get("samples") or {}
+        if all(name in raw for name in SIGNAL_CHANNELS):
+            start = timestamp_ns((entry.get("metadata") or {}).get("start_time"))
+            start = first_sample if start is None else start
+            for name in SIGNAL_CHANNELS:
+                if raw[name] and name not in timestamps and start is not None:
+                    timestamps[name] = start
+                channels[name].extend(raw[name])
+    channels = {name: np.asarray(values, dtype=np.float32) for name, values in channels.items() if values}
+    return user_id, channels, {name: timestamps[name] for name in channels if name in timestamps}
+
+
+class WebhookIngestor:
+    # Bounded queues between the webhook handler and a pool of worker threads.
+    # Every worker owns one queue and payloads are routed by key(payload) (the Terra user by
+    # default), so all payloads of one user are handled by the same worker in arrival order.
+    # submit() never blocks: when the user's queue is full it returns False so the handler can ask
+    # Terra to retry later. Workers drain up to batch_size payloads at a time (waiting at most
+    # batch_wait seconds to fill a batch) and hand them to handle_batch.
+    def __init__(self, handle_batch, maxsize=1000, num_workers=2, batch_size=64, batch_wait=0.05, key=payload_user_id):
+        self.handle_batch = handle_batch
+        self.key = key
+        self.queues = [queue.Queue(maxsize=max(1, -(-maxsize // num_workers))) for _ in range(num_workers)]
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.workers = []
+        self.stopping = threading.Event()
+
+    def start(self):
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._run, args=(self.queues[i],), name=f"ingest-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self, timeout=None):
+        self.stopping.set()
+        for worker in self.workers:
+            worker.join(timeout)
+        self.workers = []
+
+    def submit(self, payload):
+        shard = self.queues[hash(self.key(payload)) % self.num_workers]
+        try:
+            shard.put_nowait(payload)
+            return True
+        except queue.Full:
+            return False
+
+    def depth(self):
+        return sum(shard.qsize() for shard in self.queues)
+
+    def _next_batch(self, shard):
+        try:
+            batch = [shard.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(shard.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, shard):
+        while not (self.stopping.is_set() and shard.empty()):
+            batch = self._next_batch(shard)
+            if not batch:
+                continue
+            try:
+                self.handle_batch(batch)
+            except Exception:
+                _LOGGER.exception("Failed to process %d webhook payloads", len(batch))
+            finally:
+                for _ in batch:
+                    shard.task_done()
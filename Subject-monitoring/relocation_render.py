@@ -0,0 +1,90 @@
+import os
+import matplotlib
+matplotlib.use('Agg')  # Use non-interactive backend to avoid Tkinter issues
+import matplotlib.pyplot as plt
+import networkx as nx
+from pyvis.network import Network
+
+# Chart rendering for relocation plans. Runs inside background worker processes, so it only
+# touches its arguments and the output paths it is given.
+
+
+def render_relocation(graph_data, location_target, relocation_plan, plot_path, graph_path, html_path):
+    # each artifact is written under a temporary name and moved into place when complete,
+    # so readers never see a half-written file
+    plot_tmp, graph_tmp, html_tmp = ("{0}.{2}.tmp{1}".format(*os.path.splitext(path), os.getpid())
+                                     for path in (plot_path, graph_path, html_path))
+    locations = {tuple(d["location"]) for d in graph_data.values()}
+    donor_locations = {tuple(graph_data[p]["location"]) for _, p in relocation_plan}
+    # Assign colors based on role
+    colors = {}
+    for loc in locations:
+        if loc == location_target:
+            colors[loc] = "green"  # Target location
+        elif loc in donor_locations:
+            colors[loc] = "red"    # Donor locations
+        else:
+            colors[loc] = "blue"   # Other locations
+
+    # Plot locations
+    plt.figure(figsize=(8, 6))
+    for loc, color in colors.items():
+        plt.scatter(loc[0], loc[1], color=color, s=200, edgecolors="black", label=color if color not in plt.gca().get_legend_handles_labels()[1] else "")
+
+    # Labels and aesthetics
+    plt.xlabel("X Coordinate")
+    plt.ylabel("Y Coordinate")
+    plt.title("Soldier Relocation Visualization")
+    plt.legend(["Target (Green)", "Donor (Red)", "Neutral (Blue)"])
+    plt.grid(True)
+    plt.savefig(plot_tmp)
+    plt.close()
+
+    # Create NetworkX graph
+    G = nx.Graph()
+
+    # Add nodes with colors
+    for loc in locations:
+        G.add_node(loc, color=colors[loc])
+
+    # Add edges for relocations
+    edge_labels = {}
+    for donor, receiver in relocation_plan:
+        donor_loc = tuple(graph_data[donor]["location"])
+        target_loc = tuple(graph_data[receiver]["location"])
+
+        # Ensure the order of the tuple is consistent: donor -> receiver
+        edge_tuple = (donor_loc, target_loc) if donor_loc < target_loc else (target_loc, donor_loc)
+
+        G.add_edge(donor_loc, target_loc)
+        edge_labels[edge_tuple] = edge_labels.get(edge_tuple, "") + f"{donor} → {receiver} "
+
+    # --- Matplotlib Visualization ---
+    plt.figure(figsize=(8, 6))
+    pos = {loc: loc for loc in locations}  # Position nodes based on coordinates
+    node_colors = [colors[n] for n in G.nodes]
+
+    nx.draw(G, pos, with_labels=True, node_color=node_colors, edge_color="black", node_size=1000, font_size=8, font_weight="bold")
+    nx.draw_networkx_edge_labels(G, pos, edge_labels=edge_labels, font_size=7, font_color="red")
+
+    plt.title("Relocation Graph with Transfers")
+    plt.savefig(graph_tmp)
+    plt.close()
+
+    # --- Pyvis (Interactive Web Visualization) ---
+    nt = Network('500px', '500px')
+    for node in G.nodes:
+        node_id = str(node)  # Convert the tuple to a string
+        nt.add_node(node_id, color=colors[node], title=str(node))  # Add tooltips
+
+    # Then, when adding edges to the graph, make sure the correct order is followed:
+    for edge in G.edges:
+        edge_tuple = (edge[0], edge[1]) if edge[0] < edge[1] else (edge[1], edge[0])
+        label = edge_labels.get(edge_tuple, "")
+        nt.add_edge(str(edge[0]), str(edge[1]), title=label)  # Ensure edge ordering
+
+    nt.write_html(html_tmp)
+
+    os.replace(plot_tmp, plot_path)
+    os.replace(graph_tmp, graph_path)
+    os.replace(html_tmp, html_path)
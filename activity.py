@@ -0,0 +1,25 @@
+import numpy as np
+
+from batching import pad_sequences, padding_mask
+
+# Activity kernel shared by the background distribution and movement percentiles.
+# Activity is the range (max - min) of the accelerometer vector magnitude over a recording.
+
+def vm_range(signals, acc_idx, chunk_size=None):
+  # signals: list of (num_features, num_timesteps) arrays, acc_idx: [acc_x, acc_y, acc_z] feature indices
+  # chunk_size bounds how many soldiers are padded into memory at once
+  num_soldiers = len(signals)
+  chunk_size = chunk_size or max(num_soldiers, 1)
+  ranges = np.empty(num_soldiers, dtype=np.float64)
+  for start in range(0, num_soldiers, chunk_size):
+    chunk = signals[start:start + chunk_size]
+    # computed in the signals' own precision (float32 for wearable data), like a per-soldier loop would
+    dtype = np.result_type(np.float32, *(signal.dtype if isinstance(signal, np.ndarray) else np.asarray(signal[0]).dtype
+                                         for signal in chunk))
+    acc, lengths = pad_sequences(chunk, channels=acc_idx, dtype=dtype)
+    VM = np.sqrt(acc[:, 0] ** 2 + acc[:, 1] ** 2 + acc[:, 2] ** 2)
+    # VM >= 0, so zero padding never wins the max; padding is pushed to +inf for the min
+    VM_max = VM.max(axis=1)
+    VM_min = np.where(padding_mask(lengths, acc.shape[2]), np.inf, VM).min(axis=1)
+    ranges[start:start + len(chunk)] = np.where(lengths > 0, VM_max - VM_min, np.nan)
+  return ranges
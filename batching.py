@@ -0,0 +1,52 @@
+import numpy as np
+
+# Helpers for turning ragged (num_features, num_timesteps) signals into dense batches.
+# Every signal is written straight into one preallocated buffer instead of being padded
+# one at a time and stacked afterwards.
+
+def sequence_lengths(sequences):
+  return np.fromiter((len(seq[0]) for seq in sequences), dtype=np.int64, count=len(sequences))
+
+def pad_sequences(sequences, max_time=None, channels=None, dtype=np.float32, fill_value=0):
+  # sequences: list of (num_features, num_timesteps) arrays (or lists of 1-D channel arrays)
+  # channels: optional list of feature indices to keep, in order
+  # returns the (N, F, max_time) buffer and the length of every sequence in it.
+  # Sequences longer than max_time keep their newest max_time samples (like SquadMonitor.load_signals
+  # reads the last max_time samples), so one long recording never fails the batch
+  lengths = sequence_lengths(sequences)
+  if max_time is None:
+    max_time = int(lengths.max()) if len(lengths) else 0
+  skip = np.maximum(lengths - max_time, 0)
+  lengths = lengths - skip
+  num_features = len(channels) if channels is not None else (len(sequences[0]) if len(sequences) else 0)
+  buffer = np.full((len(sequences), num_features, max_time), fill_value, dtype=dtype)
+  for i, (seq, n, k) in enumerate(zip(sequences, lengths, skip)):
+    if channels is None and isinstance(seq, np.ndarray):
+      buffer[i, :, :n] = seq[:, k:]
+    else:
+      # copy channel by channel so memory-mapped channels are read exactly once
+      for c, idx in enumerate(channels if channels is not None else range(num_features)):
+        buffer[i, c, :n] = seq[idx][k:]
+  return buffer, lengths
+
+def padding_mask(lengths, max_time):
+  # True marks padded positions, matching the src_key_padding_mask convention
+  return np.arange(max_time)[None, :] >= np.asarray(lengths)[:, None]
+
+def length_buckets(lengths, max_time, max_tokens, granularity=1):
+  # group sequences of similar length so each batch is padded only to its own longest member
+  # (rounded up to a multiple of `granularity` to limit the number of distinct shapes).
+  # Sequences are taken shortest first and each batch is as large as fits in max_tokens padded
+  # timesteps. Returns a list of (indices into lengths, padded length).
+  lengths = np.asarray(lengths)
+  order = np.argsort(lengths, kind="stable")
+  padded = np.minimum(-(-np.maximum(lengths[order], 1) // granularity) * granularity, max_time)
+  buckets = []
+  start = 0
+  while start < len(order):
+    # padded is sorted, so batch size x padded length only grows with the batch size
+    tokens = np.arange(1, len(order) - start + 1) * padded[start:]
+    n = max(1, int(np.searchsorted(tokens, max_tokens, side="right")))
+    buckets.append((order[start:start + n], int(padded[start + n - 1])))
+    start += n
+  return buckets
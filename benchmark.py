@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from relocation import plan_relocation
+from spatial_index import SpatialIndex
+
+# Reproducible benchmark for the SquadMonitor pipeline and the relocation planner.
+# Builds synthetic squads in the formats the real code consumes (green / acc_x / acc_y / acc_z
+# signal arrays, metadata rows, graph_data.json-style location + health maps) with a tiny
+# stand-in metadata model and a logistic regression classifier, times every stage and prints
+# machine-readable JSON that can be diffed between versions:
+#   python benchmark.py --sizes 10 100 1000 --repeats 5 --output bench.json
+
+SIGNAL_FEATURES = ["green", "acc_x", "acc_y", "acc_z"]
+METADATA_FEATURES = ["age", "height", "weight", "resting_hr", "vo2max", "sleep"]
+OUTCOMES = ["afib", "irregular", "regular"]
+
+def make_model(num_features, num_outputs):
+  import torch
+  import torch.nn as nn
+
+  class PooledLinear(nn.Module):
+    # masked mean over time followed by a linear layer, same call signature as the real model
+    def __init__(self):
+      super().__init__()
+      self.fc = nn.Linear(num_features, num_outputs)
+
+    def forward(self, x, mask):
+      keep = (~mask).unsqueeze(1).to(x.dtype)
+      pooled = (x * keep).sum(dim=2) / keep.sum(dim=2).clamp(min=1)
+      return self.fc(pooled)
+
+  torch.manual_seed(0)
+  return PooledLinear()
+
+def make_signals(rng, num_soldiers, max_time, sample_rate):
+  # PPG-like green channel (a ~1.2 Hz pulse plus noise) and noisy accelerometer channels
+  lengths = rng.integers(max_time // 2, max_time + 1, size=num_soldiers)
+  signals = []
+  for n in lengths:
+    t = np.arange(n) / sample_rate
+    green = np.sin(2 * np.pi * rng.uniform(0.9, 1.6) * t) + 0.1 * rng.standard_normal(n)
+    acc = rng.standard_normal((3, n)) * rng.uniform(0.1, 2.0)
+    signals.append(np.vstack([green, acc]).astype(np.float32))
+  return signals
+
+def make_squad(num_soldiers, max_time=250, sample_rate=25, seed=0):
+  from sklearn.linear_model import LogisticRegression
+  from sklearn.preprocessing import LabelEncoder
+  rng = np.random.default_rng(seed)
+  signals = make_signals(rng, num_soldiers, max_time, sample_rate)
+  metadata = rng.standard_normal((num_soldiers, len(METADATA_FEATURES)))
+  label_encoder = LabelEncoder().fit(OUTCOMES)
+  # mostly regular soldiers so cohort optimisation always finds replacements
+  outcomes = rng.choice(OUTCOMES, size=num_soldiers, p=[0.1, 0.2, 0.7])
+  outcomes[:3] = OUTCOMES
+  classifier = LogisticRegression(max_iter=200).fit(metadata, label_encoder.transform(outcomes))
+  soldier_IDs = [f"soldier-{i}" for i in range(num_soldiers)]
+  model_info = {"max_time": max_time,
+                "metadata_mean": np.zeros(len(METADATA_FEATURES), dtype=np.float32),
+                "metadata_std": np.ones(len(METADATA_FEATURES), dtype=np.float32)}
+  graph_data = make_graph_data(rng, soldier_IDs)
+  return {"signals": signals, "metadata": metadata, "soldier_IDs": soldier_IDs, "classifier": classifier,
+          "label_encoder": label_encoder, "model_info": model_info, "graph_data": graph_data}
+
+def make_graph_data(rng, soldier_IDs, num_locations=None):
+  # graph_data.json layout: {person: {"location": [x, y], "health": h}} on an integer grid
+  num_locations = num_locations or max(2, len(soldier_IDs) // 5)
+  grid = rng.integers(0, 1000, size=(num_locations, 2))
+  placement = rng.integers(0, num_locations, size=len(soldier_IDs))
+  health = rng.uniform(0, 1, size=len(soldier_IDs))
+  return {ID: {"location": [int(v) for v in grid[placement[i]]], "health": float(health[i])}
+          for i, ID in enumerate(soldier_IDs)}
+
+def make_monitor(squad, **kwargs):
+  from squad_monitor import SquadMonitor
+  return SquadMonitor(squad["signals"], squad["metadata"], squad["soldier_IDs"], SIGNAL_FEATURES, METADATA_FEATURES,
+                      make_model(len(SIGNAL_FEATURES), len(METADATA_FEATURES)), "cpu", squad["model_info"],
+                      squad["classifier"], squad["label_encoder"], squad["metadata"][:1000], **kwargs)
+
+def measure(fn, items, repeats, warmup=1):
+  # latency percentiles over `repeats` timed calls, then one extra call under tracemalloc for the
+  # peak Python-side allocation (numpy buffers included, torch's allocator is not)
+  for _ in range(warmup):
+    fn()
+  latencies = []
+  for _ in range(repeats):
+    start = time.perf_counter()
+    fn()
+    latencies.append(time.perf_counter() - start)
+  tracemalloc.start()
+  fn()
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  latencies = np.array(latencies)
+  p50 = float(np.percentile(latencies, 50))
+  return {"items": items,
+          "repeats": repeats,
+          "p50_s": p50,
+          "p99_s": float(np.percentile(latencies, 99)),
+          "mean_s": float(latencies.mean()),
+          "throughput_per_s": items / p50 if p50 > 0 else None,
+          "peak_traced_bytes": peak,
+          "max_rss_bytes": max_rss_bytes()}
+
+def max_rss_bytes():
+  # ru_maxrss is KiB on Linux and bytes on macOS
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return rss if sys.platform == "darwin" else rss * 1024
+
+def bench_size(num_soldiers, max_time, repeats, cohort_size):
+  squad = make_squad(num_soldiers, max_time)
+  signals, metadata, IDs = squad["signals"], squad["metadata"], squad["soldier_IDs"]
+  results = {}
+
+  start = time.perf_counter()
+  monitor = make_monitor(squad)
+  results["construct"] = {"items": num_soldiers, "seconds": time.perf_counter() - start, "max_rss_bytes": max_rss_bytes()}
+
+  results["generate_metadata"] = measure(lambda: monitor.generate_metadata(signals, IDs), num_soldiers, repeats)
+  results["generate_heart_metrics"] = measure(lambda: monitor.generate_heart_metrics(signals, IDs), num_soldiers, repeats)
+  results["generate_movement_data"] = measure(lambda: monitor.generate_movement_data(signals, IDs), num_soldiers, repeats)
+  results["generate_health_predictions"] = measure(lambda: monitor.generate_health_predictions(metadata, IDs), num_soldiers, repeats)
+
+  cohort = min(cohort_size, num_soldiers // 2)
+  np.random.seed(0)
+  results["optimize_cohort"] = measure(lambda: monitor.optimize_cohort(metadata[:cohort], list(IDs[:cohort])), cohort, repeats)
+
+  graph_data = squad["graph_data"]
+  target = tuple(graph_data[IDs[0]]["location"])
+  results["plan_relocation"] = measure(lambda: plan_relocation(graph_data, target, 0.9), num_soldiers, repeats)
+  index = SpatialIndex(graph_data)
+  results["plan_relocation_indexed"] = measure(lambda: plan_relocation(graph_data, target, 0.9, index=index), num_soldiers, repeats)
+  targets = list({tuple(graph_data[ID]["location"]) for ID in IDs[:50]})[:5]
+  results["plan_relocation_multi"] = measure(lambda: plan_relocation(graph_data, targets, 0.9), num_soldiers, repeats)
+  return results
+
+def environment():
+  import torch
+  import sklearn
+  return {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+          "numpy": np.__version__, "torch": torch.__version__, "sklearn": sklearn.__version__,
+          "torch_threads": torch.get_num_threads()}
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Benchmark the SquadMonitor pipeline and relocation planner")
+  parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+  parser.add_argument("--max-time", type=int, default=250, help="timesteps per recording (25 Hz)")
+  parser.add_argument("--repeats", type=int, default=5)
+  parser.add_argument("--cohort-size", type=int, default=10)
+  parser.add_argument("--output", help="write JSON here instead of stdout")
+  args = parser.parse_args(argv)
+
+  report = {"environment": environment(),
+            "config": {"max_time": args.max_time, "repeats": args.repeats, "cohort_size": args.cohort_size},
+            "results": {}}
+  for size in args.sizes:
+    print(f"benchmarking {size} soldiers", file=sys.stderr)
+    report["results"][str(size)] = bench_size(size, args.max_time, args.repeats, args.cohort_size)
+
+  text = json.dumps(report, indent=2)
+  if args.output:
+    with open(args.output, "w") as f:
+      f.write(text + "\n")
+  else:
+    print(text)
+  return report
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,173 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Batched LIME explanations for a LimeTabularExplainer built with discretize_continuous=True
+# (the default, and what SquadMonitor uses).
+# explain_instance draws a fresh neighbourhood per row, but with a discretizer the sampled bins
+# do not depend on the row being explained: only the binary "same bin as the row" encoding and
+# the first (instance) row do. So one neighbourhood is sampled and classified for the whole batch,
+# and each row only adds its own instance prediction plus its ridge fits, which run in a process
+# pool.
+
+def _kernel(d, kernel_width):
+  # same kernel as LimeTabularExplainer's default
+  return np.sqrt(np.exp(-(d ** 2) / kernel_width ** 2))
+
+def _ridge(gram, cross, features, alpha):
+  # weighted ridge coefficients on a feature subset from the centered, weighted Gram matrix
+  sub = gram[np.ix_(features, features)] + alpha * np.eye(len(features))
+  return np.linalg.lstsq(sub, cross[features], rcond=None)[0]
+
+def _r2(gram, cross, total, features, coef):
+  # weighted R^2 of a ridge fit, as Ridge.score(..., sample_weight=weights) reports it
+  residual = total - 2 * coef @ cross[features] + coef @ gram[np.ix_(features, features)] @ coef
+  return 1 - residual / total if total > 0 else 0.0
+
+def _select_features(gram, cross, total, instance, num_features, method):
+  # LimeBase.feature_selection on the sufficient statistics instead of repeated Ridge fits
+  n = len(cross)
+  if method == "auto":
+    method = "forward_selection" if num_features <= 6 else "highest_weights"
+  if method == "none":
+    return list(range(n))
+  if method == "highest_weights":
+    weighted = _ridge(gram, cross, list(range(n)), 0.01) * instance
+    return sorted(range(n), key=lambda f: abs(weighted[f]), reverse=True)[:num_features]
+  used = []
+  for _ in range(min(num_features, n)):
+    best, best_score = 0, -100000000
+    for feature in range(n):
+      if feature in used:
+        continue
+      features = used + [feature]
+      score = _r2(gram, cross, total, features, _ridge(gram, cross, features, 0))
+      if score > best_score:
+        best, best_score = feature, score
+    used.append(best)
+  return used
+
+def _fit_rows(shared_bins, shared_probs, row_bins, row_probs, scaler_mean, scaler_scale,
+              kernel_width, labels, num_features, feature_selection):
+  # LimeBase.explain_instance_with_data for a chunk of rows against the shared neighbourhood.
+  # Every fit LIME makes is a weighted ridge regression on the same design matrix, so each row
+  # builds the weighted Gram matrix once and each fit is a tiny F x F solve.
+  ones = (1 - scaler_mean) / scaler_scale
+  results = []
+  for bins, probs in zip(row_bins, row_probs):
+    binary = np.vstack([np.ones(len(bins)), (shared_bins == bins).astype(np.float64)])
+    scaled = (binary - scaler_mean) / scaler_scale
+    weights = _kernel(np.sqrt(((scaled - ones) ** 2).sum(axis=1)), kernel_width)
+    yss = np.vstack([probs, shared_probs])
+    centered = scaled - np.average(scaled, axis=0, weights=weights)
+    gram = (centered * weights[:, None]).T @ centered
+    explanation = {}
+    for label in labels:
+      y = yss[:, label] - np.average(yss[:, label], weights=weights)
+      cross = centered.T @ (weights * y)
+      total = weights @ (y * y)
+      features = _select_features(gram, cross, total, scaled[0], num_features, feature_selection)
+      coef = _ridge(gram, cross, features, 1)
+      local_exp = sorted(zip(features, coef), key=lambda x: abs(x[1]), reverse=True)
+      explanation[label] = [(int(feature), float(weight)) for feature, weight in local_exp]
+    results.append(explanation)
+  return results
+
+class BatchExplainer():
+  def __init__(self, explainer, predict_fn, num_samples=5000, num_workers=None, chunk_size=32,
+               decimals=3, cache_size=4096):
+    if explainer.discretizer is None:
+      raise ValueError("BatchExplainer needs an explainer built with discretize_continuous=True")
+    if explainer.feature_selection == "lasso_path":
+      raise ValueError("BatchExplainer does not support feature_selection='lasso_path'")
+    self.explainer = explainer
+    self.predict_fn = predict_fn
+    self.num_samples = num_samples
+    # num_workers=0 fits in the calling process
+    self.num_workers = num_workers
+    self.chunk_size = chunk_size
+    # rows equal after rounding to `decimals` share a cached explanation
+    self.decimals = decimals
+    self.cache_size = cache_size
+    self.cache = OrderedDict()
+    self.pool = None
+
+  def _neighbourhood(self):
+    # num_samples - 1 sampled bins and their un-discretized feature values; row 0 is the instance
+    explainer = self.explainer
+    n = self.num_samples - 1
+    columns = range(len(explainer.feature_values))
+    bins = np.column_stack([explainer.random_state.choice(explainer.feature_values[c], size=n, replace=True,
+                                                          p=explainer.feature_frequencies[c]) for c in columns])
+    return bins, explainer.discretizer.undiscretize(bins.astype(np.float64))
+
+  def _key(self, row, labels, num_features):
+    return (np.round(row, self.decimals).tobytes(), tuple(labels), num_features)
+
+  def explain(self, rows, labels=(1,), num_features=None):
+    # rows: (N, F) metadata rows -> list of N as_map() dicts {label: [(feature, weight), ...]}
+    rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+    num_features = rows.shape[1] if num_features is None else num_features
+    keys = [self._key(row, labels, num_features) for row in rows]
+    todo = {}
+    for i, key in enumerate(keys):
+      if key not in self.cache and key not in todo:
+        todo[key] = i
+    if todo:
+      order = list(todo.values())
+      for key, explanation in zip(todo, self._explain_rows(rows[order], labels, num_features)):
+        self.cache[key] = explanation
+      while len(self.cache) > self.cache_size:
+        self.cache.popitem(last=False)
+    results = []
+    for key in keys:
+      self.cache.move_to_end(key)
+      results.append(self.cache[key])
+    return results
+
+  def _explain_rows(self, rows, labels, num_features):
+    explainer = self.explainer
+    shared_bins, shared_inverse = self._neighbourhood()
+    # a single classifier pass over the shared neighbourhood and every instance row
+    probs = self.predict_fn(np.vstack([rows, shared_inverse]))
+    row_probs, shared_probs = probs[:len(rows)], probs[len(rows):]
+    row_bins = explainer.discretizer.discretize(rows)
+    chunks = [(shared_bins, shared_probs, row_bins[s:s + self.chunk_size], row_probs[s:s + self.chunk_size],
+               explainer.scaler.mean_, explainer.scaler.scale_, explainer.base.kernel_fn.keywords["kernel_width"],
+               labels, num_features, explainer.feature_selection)
+              for s in range(0, len(rows), self.chunk_size)]
+    if self.num_workers == 0 or len(chunks) == 1:
+      return [explanation for chunk in chunks for explanation in _fit_rows(*chunk)]
+    if self.pool is None:
+      self.pool = ProcessPoolExecutor(max_workers=self.num_workers)
+    return [explanation for result in self.pool.map(_fit_rows, *zip(*chunks)) for explanation in result]
+
+  def close(self):
+    if self.pool is not None:
+      self.pool.shutdown()
+      self.pool = None
+
+# Closed-form explanations for linear classifiers (e.g. the logistic regression disease
+# classifier). A feature's contribution to class k is coef[k, f] * (x_f - mean_f): how much it
+# moves that class's decision function away from its value at the training mean. One einsum
+# covers every soldier, so there is nothing to sample.
+
+def is_linear(classifier):
+  return hasattr(classifier, "coef_") and hasattr(classifier, "intercept_")
+
+def linear_contributions(classifier, rows, feature_means):
+  # (N, F) rows -> (N, C, F) per-class, per-feature contributions
+  coef = np.asarray(classifier.coef_, dtype=np.float64)
+  if coef.shape[0] == 1 and len(classifier.classes_) == 2:
+    # binary models store only the positive class; the negative class mirrors it
+    coef = np.vstack([-coef, coef])
+  centered = np.atleast_2d(np.asarray(rows, dtype=np.float64)) - np.asarray(feature_means, dtype=np.float64)
+  return np.einsum("kf,nf->nkf", coef, centered)
+
+def contributions_as_map(contributions, labels=(1,), num_features=None):
+  # (N, C, F) contributions -> list of N as_map()-style dicts, strongest features first
+  num_features = contributions.shape[2] if num_features is None else num_features
+  order = np.argsort(-np.abs(contributions), axis=2, kind="stable")[:, :, :num_features]
+  return [{label: [(int(f), float(row[label, f])) for f in row_order[label]] for label in labels}
+          for row, row_order in zip(contributions, order)]
@@ -11,36 +11,16 @@ import matplotlib.pyplot as plt
 import networkx as nx
 from pyvis.network import Network
 
+from relocation import plan_relocation
+
 graph_data = json.load(open("graph_data.json", "r"))
 
 location_target = (2, 3)
 threshold = 0.9
 
-target_soldiers = {p: d for p, d in graph_data.items() if tuple(d["location"]) == location_target}
-below_threshold = {p for p, d in target_soldiers.items() if d["health"] < threshold}
-
-healthy_soldiers = {p: d for p, d in graph_data.items() if d["health"] >= threshold and tuple(d["location"]) != location_target}
-
-def distance(loc1, loc2):
-    return (loc1[0] - loc2[0]) ** 2 + (loc1[1] - loc2[1]) ** 2
-
-# Greedy algorithm which minimizes the distance that you would have to move healthy troops from other locations to get them to be at location_target
-# The output should be a list of tuples (person_a, person_b), where person_a is the person to be replaced, and person_b is the person replacing them. 
-total_cost = 0
-relocation_plan = []
-for soldier in below_threshold:
-    if not healthy_soldiers:
-        break  # No more healthy soldiers to move
-    
-    # Find the closest healthy soldier
-    closest_replacement = min(healthy_soldiers, key=lambda s: distance(tuple(healthy_soldiers[s]["location"]), location_target))
-    total_cost += distance(tuple(healthy_soldiers[closest_replacement]["location"]), location_target)
-    
-    # Record the move
-    relocation_plan.append((soldier, closest_replacement))
-    
-    # Remove the moved soldier from available replacements
-    del healthy_soldiers[closest_replacement]
+# Minimum-cost assignment of healthy troops from other locations to replace those below threshold at location_target
+# The output is a list of tuples (person_a, person_b), where person_a is the person to be replaced, and person_b is the person replacing them.
+relocation_plan, total_cost = plan_relocation(graph_data, location_target, threshold)
 
 # Output the final relocation plan
 print(relocation_plan)
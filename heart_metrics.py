@@ -0,0 +1,243 @@
+import numpy as np
+
+# Squad-wide HRV engine.
+# Works on a padded (num_soldiers, num_timesteps) array of PPG samples at once:
+# peaks, RR intervals and the per-soldier statistics are all computed without a
+# per-soldier or per-peak Python loop.
+
+def detect_peaks(signals, lengths, height=0):
+  # local maxima at or above `height`, ignoring padded positions and the two boundary samples.
+  # Same convention as scipy.signal.find_peaks: a flat-topped peak (a run of equal samples, common
+  # with integer ADC counts) is one peak at the middle of the run, the left middle sample for even
+  # widths, and counts only if the samples on both sides of the run are lower.
+  signals = np.asarray(signals)
+  num_soldiers, num_timesteps = signals.shape
+  if num_timesteps < 3:
+    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+  # last index of the run of equal samples each position belongs to
+  run_ends = np.c_[signals[:, 1:] != signals[:, :-1], np.ones(num_soldiers, dtype=bool)]
+  run_end = np.where(run_ends, np.arange(num_timesteps), num_timesteps)
+  run_end = np.minimum.accumulate(run_end[:, ::-1], axis=1)[:, ::-1]
+  # a rising edge starts a run; it is a peak if the run is followed by a drop inside the recording
+  rows, starts = np.nonzero(signals[:, :-1] < signals[:, 1:])
+  starts = starts + 1
+  ends = run_end[rows, starts]
+  inside = ends <= np.asarray(lengths)[rows] - 2
+  rows, starts, ends = rows[inside], starts[inside], ends[inside]
+  is_peak = signals[rows, ends + 1] < signals[rows, starts]
+  if height is not None:
+    is_peak &= signals[rows, starts] >= height
+  return rows[is_peak], (starts[is_peak] + ends[is_peak]) // 2
+
+def _per_row_mean(values, rows, counts):
+  totals = np.bincount(rows, weights=values, minlength=len(counts))
+  return np.divide(totals, counts, out=np.full(len(counts), np.nan), where=counts > 0)
+
+def hrv_metrics(signals, lengths, sample_rate, height=0):
+  # signals: (N, T) padded PPG (green) samples, lengths: true length per row
+  # returns a columnar dict; per-peak arrays are flat and split by peak_offsets (CSR layout)
+  num_soldiers = len(lengths)
+  rows, peaks = detect_peaks(signals, lengths, height)
+
+  peak_counts = np.bincount(rows, minlength=num_soldiers)
+  peak_offsets = np.concatenate([[0], np.cumsum(peak_counts)])
+
+  # running heart rate: i beats observed after peaks[i] samples -> beats per minute
+  rank = np.arange(len(peaks)) - peak_offsets[rows]
+  bpm = np.divide(rank * 60.0 * sample_rate, peaks, out=np.full(len(peaks), np.nan), where=rank > 0)
+
+  # RR intervals (seconds) between consecutive peaks of the same soldier
+  same_row = rows[1:] == rows[:-1]
+  rr_rows = rows[1:][same_row]
+  rr = (np.diff(peaks) / sample_rate)[same_row]
+  rr_counts = np.bincount(rr_rows, minlength=num_soldiers)
+  mean_rr = _per_row_mean(rr, rr_rows, rr_counts)
+  sdnn = np.sqrt(_per_row_mean((rr - mean_rr[rr_rows]) ** 2, rr_rows, rr_counts))
+
+  # successive differences of RR intervals
+  same_rr_row = rr_rows[1:] == rr_rows[:-1]
+  sd_rows = rr_rows[1:][same_rr_row]
+  successive = np.diff(rr)[same_rr_row]
+  rmssd = np.sqrt(_per_row_mean(successive ** 2, sd_rows, np.bincount(sd_rows, minlength=num_soldiers)))
+
+  return {
+    "peak_offsets": peak_offsets,
+    "peak_index": peaks,
+    "bpm": bpm,
+    "rr_offsets": np.concatenate([[0], np.cumsum(rr_counts)]),
+    "rr": rr,
+    "heart_rate": 60.0 / mean_rr,
+    "mean_rr": mean_rr,
+    "sdnn": sdnn,
+    "rmssd": rmssd,
+  }
+
+# Online HRV estimator for continuous monitoring.
+# Each new RR interval updates mean RR, SDNN and RMSSD in O(1) using Welford-style
+# running statistics, so polling never recomputes over the full history.
+# State for every soldier lives in flat arrays (a few floats per soldier).
+#   window=None, decay=None -> statistics over the full history
+#   window=W                -> statistics over the last W RR intervals
+#   decay=alpha             -> exponentially weighted statistics (weight alpha on the newest interval)
+
+class OnlineHRV():
+  def __init__(self, window=None, decay=None, initial_capacity=64):
+    if window is not None and decay is not None:
+      raise ValueError("use either a fixed window or a decay factor, not both")
+    if window is not None and window < 2:
+      raise ValueError("window must hold at least 2 RR intervals")
+    if decay is not None and not 0 < decay <= 1:
+      raise ValueError("decay must be in (0, 1]")
+    self.window = window
+    self.decay = decay
+    self.soldier_IDs = []
+    self.rows = {}  # soldier_ID -> row in the state arrays
+
+    self.last_peak = np.full(initial_capacity, np.nan)  # time (s) of the last peak seen
+    self.last_rr = np.full(initial_capacity, np.nan)
+    self.count = np.zeros(initial_capacity, dtype=np.int64)  # RR intervals in the current window
+    self.mean = np.zeros(initial_capacity)
+    self.m2 = np.zeros(initial_capacity)  # sum of squared deviations (or EW variance with decay)
+    self.sd_count = np.zeros(initial_capacity, dtype=np.int64)
+    self.sd_sq = np.zeros(initial_capacity)  # sum (or EW mean) of squared successive differences
+    if window is not None:
+      self.rr_ring = np.zeros((initial_capacity, window))
+      self.sd_ring = np.zeros((initial_capacity, window - 1))
+      self.rr_total = np.zeros(initial_capacity, dtype=np.int64)  # RR intervals ever seen
+      self.sd_total = np.zeros(initial_capacity, dtype=np.int64)  # successive differences ever seen
+
+  def _state(self):
+    names = ["last_peak", "last_rr", "count", "mean", "m2", "sd_count", "sd_sq"]
+    if self.window is not None:
+      names += ["rr_ring", "sd_ring", "rr_total", "sd_total"]
+    return names
+
+  def _rows(self, soldier_IDs):
+    rows = np.empty(len(soldier_IDs), dtype=np.int64)
+    for i, ID in enumerate(soldier_IDs):
+      row = self.rows.get(ID)
+      if row is None:
+        row = self.rows[ID] = len(self.soldier_IDs)
+        self.soldier_IDs.append(ID)
+      rows[i] = row
+    capacity = len(self.mean)
+    if len(self.soldier_IDs) > capacity:
+      grow = max(capacity, len(self.soldier_IDs) - capacity)
+      for name in self._state():
+        array = getattr(self, name)
+        fill = np.nan if name in ("last_peak", "last_rr") else 0
+        extra = np.full((grow,) + array.shape[1:], fill, dtype=array.dtype)
+        setattr(self, name, np.concatenate([array, extra]))
+    return rows
+
+  def add_peaks(self, soldier_IDs, peak_times):
+    # peak_times in seconds, in time order for each soldier
+    soldier_IDs = [soldier_IDs] * len(peak_times) if np.isscalar(soldier_IDs) else soldier_IDs
+    rows = self._rows(soldier_IDs)
+    peak_times = np.asarray(peak_times, dtype=float)
+    order = np.argsort(rows, kind="stable")
+    rows, peak_times = rows[order], peak_times[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = rows[1:] != rows[:-1]
+    previous = np.empty_like(peak_times)
+    previous[first] = self.last_peak[rows[first]]
+    previous[~first] = peak_times[:-1][~first[1:]]
+    self.last_peak[rows] = peak_times  # last write per row wins
+    valid = ~np.isnan(previous)
+    self._add(rows[valid], peak_times[valid] - previous[valid])
+
+  def add_intervals(self, soldier_IDs, rr):
+    # RR intervals in seconds, in time order for each soldier
+    soldier_IDs = [soldier_IDs] * len(rr) if np.isscalar(soldier_IDs) else soldier_IDs
+    rows = self._rows(soldier_IDs)
+    self._add(rows, np.asarray(rr, dtype=float))
+
+  def _add(self, rows, rr):
+    # process the k-th interval of every soldier together so each round touches unique rows
+    order = np.argsort(rows, kind="stable")
+    rows, rr = rows[order], rr[order]
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.zeros(0, dtype=np.int64)
+    rank = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+    for k in range(rank.max() + 1 if len(rank) else 0):
+      selected = rank == k
+      self._update(rows[selected], rr[selected])
+
+  def _update(self, rows, x):
+    successive = x - self.last_rr[rows]
+    has_successive = ~np.isnan(successive)
+    self.last_rr[rows] = x
+
+    if self.decay is not None:
+      alpha = self.decay
+      first = self.count[rows] == 0
+      diff = x - self.mean[rows]
+      increment = alpha * diff
+      self.mean[rows] = np.where(first, x, self.mean[rows] + increment)
+      self.m2[rows] = np.where(first, 0.0, (1 - alpha) * (self.m2[rows] + diff * increment))
+      self.count[rows] += 1
+      sd_rows = rows[has_successive]
+      sd_sq = successive[has_successive] ** 2
+      first_sd = self.sd_count[sd_rows] == 0
+      self.sd_sq[sd_rows] = np.where(first_sd, sd_sq, self.sd_sq[sd_rows] + alpha * (sd_sq - self.sd_sq[sd_rows]))
+      self.sd_count[sd_rows] += 1
+      return
+
+    if self.window is None:
+      self.count[rows] += 1
+      diff = x - self.mean[rows]
+      self.mean[rows] += diff / self.count[rows]
+      self.m2[rows] += diff * (x - self.mean[rows])
+      sd_rows = rows[has_successive]
+      self.sd_sq[sd_rows] += successive[has_successive] ** 2
+      self.sd_count[sd_rows] += 1
+      return
+
+    # fixed window: add the new interval, and drop the oldest one once the window is full
+    window = self.window
+    count = self.count[rows]
+    slot = self.rr_total[rows] % window
+    full = count == window
+    old = self.rr_ring[rows, slot]
+    self.rr_ring[rows, slot] = x
+    mean = self.mean[rows]
+    # Welford add
+    new_count = np.where(full, count, count + 1)
+    add_mean = mean + (x - mean) / new_count
+    add_m2 = self.m2[rows] + (x - mean) * (x - add_mean)
+    # Welford replace (window full): swap old for new at constant count
+    replace_mean = mean + (x - old) / window
+    replace_m2 = self.m2[rows] + (x - old) * (x - replace_mean + old - mean)
+    self.mean[rows] = np.where(full, replace_mean, add_mean)
+    self.m2[rows] = np.maximum(np.where(full, replace_m2, add_m2), 0.0)
+    self.count[rows] = new_count
+    self.rr_total[rows] += 1
+
+    sd_rows = rows[has_successive]
+    sd_sq = successive[has_successive] ** 2
+    sd_slot = self.sd_total[sd_rows] % (window - 1)
+    sd_full = self.sd_count[sd_rows] == window - 1
+    self.sd_sq[sd_rows] += sd_sq - np.where(sd_full, self.sd_ring[sd_rows, sd_slot], 0.0)
+    self.sd_ring[sd_rows, sd_slot] = sd_sq
+    self.sd_count[sd_rows] = np.where(sd_full, window - 1, self.sd_count[sd_rows] + 1)
+    self.sd_total[sd_rows] += 1
+
+  def metrics(self, soldier_IDs=None):
+    # columnar snapshot of the current estimates; NaN until enough intervals have arrived
+    rows = np.arange(len(self.soldier_IDs)) if soldier_IDs is None else np.array([self.rows[ID] for ID in soldier_IDs], dtype=np.int64)
+    count = self.count[rows]
+    mean_rr = np.where(count > 0, self.mean[rows], np.nan)
+    if self.decay is not None:
+      variance = self.m2[rows]
+      msd = self.sd_sq[rows]
+    else:
+      variance = np.divide(self.m2[rows], count, out=np.full(len(rows), np.nan), where=count > 0)
+      msd = np.divide(self.sd_sq[rows], self.sd_count[rows], out=np.full(len(rows), np.nan), where=self.sd_count[rows] > 0)
+    sdnn = np.where(count > 0, np.sqrt(variance), np.nan)
+    rmssd = np.where(self.sd_count[rows] > 0, np.sqrt(msd), np.nan)
+    return {
+      "soldier_IDs": [self.soldier_IDs[row] for row in rows],
+      "heart_rate": 60.0 / mean_rr,
+      "mean_rr": mean_rr,
+      "sdnn": sdnn,
+      "rmssd": rmssd,
+    }
@@ -0,0 +1,77 @@
+import numpy as np
+
+# Inference backends for the metadata model.
+# Every backend is called as backend(x, mask) with x (batch, num_features, num_timesteps) and a
+# boolean padding mask (batch, num_timesteps), exactly like the eager model, and returns a
+# (batch, num_metadata_features) numpy array.
+#   eager       the nn.Module as given
+#   torchscript torch.jit.trace + freeze, traced once per padded length it sees
+#   compile     torch.compile with dynamic shapes
+#   quantized   torch.ao dynamic int8 quantization of the Linear layers (CPU only)
+# In inference mode the eager nn.TransformerEncoder takes a nested-tensor fast path that zeroes
+# padded positions. compile and quantized cannot take it and compute padded positions the way
+# training did, so with a padding mask their outputs can differ from eager; run
+# check_consistency before switching a deployment to them.
+
+BACKENDS = ("eager", "torchscript", "compile", "quantized")
+
+class InferenceBackend():
+  def __init__(self, model, kind="eager", device="cpu", num_threads=None):
+    import torch
+    if kind not in BACKENDS:
+      raise ValueError(f"unknown inference backend {kind}, expected one of {BACKENDS}")
+    if kind == "quantized" and torch.device(device).type != "cpu":
+      raise ValueError("dynamic int8 quantization only runs on CPU")
+    if num_threads is not None:
+      # intra-op parallelism is process-wide in torch
+      torch.set_num_threads(num_threads)
+    self.model = model.to(device).eval()
+    self.kind = kind
+    self.device = device
+    self.num_threads = num_threads
+    self.runner = None
+    # torchscript: one traced graph per padded length, since tracing may specialise on it
+    self.traced = {}
+    if kind == "eager":
+      self.runner = self.model
+    elif kind == "compile":
+      self.runner = torch.compile(self.model, dynamic=True)
+    elif kind == "quantized":
+      self.runner = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+  def _trace(self, x, mask):
+    import torch
+    with torch.inference_mode(False), torch.no_grad():
+      traced = torch.jit.trace(self.model, (x, mask), check_trace=False)
+      return torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+
+  def __call__(self, x, mask):
+    import torch
+    x, mask = x.to(self.device), mask.to(self.device)
+    runner = self.runner
+    if self.kind == "torchscript":
+      if x.shape[2] not in self.traced:
+        self.traced[x.shape[2]] = self._trace(x, mask)
+      runner = self.traced[x.shape[2]]
+    with torch.inference_mode():
+      if self.kind != "quantized":
+        return runner(x, mask).cpu().numpy()
+      # the attention fast path reads Linear weights directly, which quantized Linears do not have
+      fastpath = torch.backends.mha.get_fastpath_enabled()
+      torch.backends.mha.set_fastpath_enabled(False)
+      try:
+        return runner(x, mask).cpu().numpy()
+      finally:
+        torch.backends.mha.set_fastpath_enabled(fastpath)
+
+  def check_consistency(self, x, mask, atol=1e-3, rtol=1e-3):
+    # compare against the eager model on the same inputs; returns the max absolute difference
+    # and raises if the backend drifts past the tolerance
+    import torch
+    with torch.inference_mode():
+      expected = self.model(x.to(self.device), mask.to(self.device)).cpu().numpy()
+    actual = self(x, mask)
+    max_diff = float(np.max(np.abs(actual - expected))) if expected.size else 0.0
+    if not np.allclose(actual, expected, atol=atol, rtol=rtol):
+      raise ValueError(f"{self.kind} backend differs from the eager model by up to {max_diff:.3g}")
+    return max_diff
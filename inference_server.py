@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+from instrumentation import set_gauge
+
+# Request-coalescing front end for SquadMonitor.
+# Concurrent per-soldier requests are queued; a single batching loop takes the first waiting
+# request, keeps collecting for at most max_wait seconds (or until max_batch requests), runs
+# generate_metadata + generate_health_predictions once for the whole batch in a worker thread
+# and resolves every waiting request with its own row. While a batch runs, new requests pile up
+# and form the next batch, so throughput grows with concurrency instead of collapsing.
+
+class MicroBatcher():
+  def __init__(self, monitor, max_batch=64, max_wait=0.005, max_queue=0, executor=None):
+    self.monitor = monitor
+    self.max_batch = max_batch
+    self.max_wait = max_wait
+    # 0 means unbounded; otherwise submit() waits for room (backpressure)
+    self.max_queue = max_queue
+    # None runs batches on the event loop's default thread pool
+    self.executor = executor
+    self.queue = None
+    self.task = None
+    self.stats = {"requests": 0, "batches": 0, "errors": 0, "max_queue_depth": 0,
+                  "last_batch_size": 0, "total_batch_size": 0, "total_wait": 0.0, "total_run": 0.0}
+
+  async def start(self):
+    self.queue = asyncio.Queue(self.max_queue)
+    self.task = asyncio.create_task(self._run())
+
+  async def stop(self):
+    # finish everything already queued, then stop the batching loop
+    await self.queue.join()
+    self.task.cancel()
+    try:
+      await self.task
+    except asyncio.CancelledError:
+      pass
+
+  async def submit(self, soldier_ID, signal):
+    # signal: (num_features, num_timesteps) array -> (outcome, percentile), as end_to_end returns per soldier
+    future = asyncio.get_running_loop().create_future()
+    await self.queue.put((soldier_ID, signal, future, time.perf_counter()))
+    self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.queue.qsize())
+    set_gauge("queue_depth", self.queue.qsize(), queue="inference")
+    return await future
+
+  def queue_depth(self):
+    return self.queue.qsize() if self.queue is not None else 0
+
+  def metrics(self):
+    batches = self.stats["batches"]
+    return dict(self.stats, queue_depth=self.queue_depth(),
+                mean_batch_size=self.stats["total_batch_size"] / batches if batches else 0.0,
+                mean_wait=self.stats["total_wait"] / self.stats["requests"] if self.stats["requests"] else 0.0,
+                mean_run=self.stats["total_run"] / batches if batches else 0.0)
+
+  async def _collect(self):
+    batch = [await self.queue.get()]
+    deadline = time.perf_counter() + self.max_wait
+    while len(batch) < self.max_batch:
+      remaining = deadline - time.perf_counter()
+      if remaining <= 0:
+        break
+      try:
+        batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+      except asyncio.TimeoutError:
+        break
+    return batch
+
+  def _predict(self, signals):
+    # positional keys, so the same soldier requested twice in one batch gets two results
+    keys = list(range(len(signals)))
+    metadata = self.monitor.generate_metadata(signals, keys)
+    predictions = self.monitor.generate_health_predictions(metadata.values, keys)
+    return [predictions[key] for key in keys]
+
+  def _predict_each(self, signals):
+    # after a failed batch, run requests one at a time so only the bad ones fail
+    results = []
+    for signal in signals:
+      try:
+        results.append(self._predict([signal])[0])
+      except Exception as error:
+        results.append(error)
+    return results
+
+  async def _run(self):
+    loop = asyncio.get_running_loop()
+    while True:
+      batch = await self._collect()
+      started = time.perf_counter()
+      try:
+        signals = [signal for _, signal, _, _ in batch]
+        try:
+          results = await loop.run_in_executor(self.executor, self._predict, signals)
+        except Exception:
+          results = await loop.run_in_executor(self.executor, self._predict_each, signals)
+        for (_, _, future, _), result in zip(batch, results):
+          if future.done():
+            continue
+          if isinstance(result, Exception):
+            self.stats["errors"] += 1
+            future.set_exception(result)
+          else:
+            future.set_result(result)
+      finally:
+        finished = time.perf_counter()
+        self.stats["batches"] += 1
+        self.stats["requests"] += len(batch)
+        self.stats["last_batch_size"] = len(batch)
+        self.stats["total_batch_size"] += len(batch)
+        self.stats["total_wait"] += sum(started - queued for _, _, _, queued in batch)
+        self.stats["total_run"] += finished - started
+        for _ in batch:
+          self.queue.task_done()
@@ -0,0 +1,181 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+# Lightweight metrics for the squad pipeline and the Flask services.
+# Stage timings, batch sizes, tensor bytes and queue depths are recorded into fixed-bucket
+# histograms / gauges and rendered in the Prometheus text format (render()). Recording is off
+# unless SQUAD_METRICS=1 or enable() is called; while off, timer() hands back a shared no-op
+# context manager and observe()/set_gauge() return immediately, so instrumented code pays one
+# flag check per call site.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = tuple(4 ** i for i in range(10))  # 1 .. 262144
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1 KiB .. 1 GiB
+
+# name -> (type, help, buckets)
+METRICS = {
+  "squad_stage_seconds": ("histogram", "Time spent in each SquadMonitor stage", LATENCY_BUCKETS),
+  "squad_batch_size": ("histogram", "Soldiers per model or classifier call", SIZE_BUCKETS),
+  "squad_tensor_bytes": ("histogram", "Bytes in padded input tensors", BYTES_BUCKETS),
+  "http_request_seconds": ("histogram", "Flask route latency", LATENCY_BUCKETS),
+  "queue_depth": ("gauge", "Items waiting in a work queue", None),
+}
+
+_NULL_TIMER = nullcontext()
+_state = {"enabled": os.getenv("SQUAD_METRICS", "0") == "1"}
+
+class Histogram():
+  def __init__(self, buckets):
+    self.buckets = tuple(buckets)
+    self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+    self.sum = 0.0
+    self.count = 0
+
+  def observe(self, value):
+    # Prometheus buckets count observations <= le
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.sum += value
+    self.count += 1
+
+class Registry():
+  def __init__(self):
+    self.series = {}  # name -> {sorted label items: Histogram or float}
+    self.lock = threading.Lock()
+
+  def observe(self, name, value, labels):
+    kind, _, buckets = METRICS.get(name, ("histogram", "", LATENCY_BUCKETS))
+    key = tuple(sorted(labels.items()))
+    with self.lock:
+      series = self.series.setdefault(name, {})
+      histogram = series.get(key)
+      if histogram is None:
+        histogram = series[key] = Histogram(buckets)
+      histogram.observe(value)
+
+  def set_gauge(self, name, value, labels):
+    with self.lock:
+      self.series.setdefault(name, {})[tuple(sorted(labels.items()))] = float(value)
+
+  def clear(self):
+    with self.lock:
+      self.series.clear()
+
+  def render(self):
+    lines = []
+    with self.lock:
+      for name in sorted(self.series):
+        kind, help_text, _ = METRICS.get(name, ("histogram", "", None))
+        if help_text:
+          lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in sorted(self.series[name].items()):
+          if kind == "gauge":
+            lines.append(f"{name}{_labels(key)} {value}")
+            continue
+          cumulative = 0
+          for bound, count in zip(value.buckets + (float("inf"),), value.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+          lines.append(f"{name}_sum{_labels(key)} {value.sum}")
+          lines.append(f"{name}_count{_labels(key)} {value.count}")
+    return "\n".join(lines) + "\n"
+
+def _labels(items):
+  if not items:
+    return ""
+  escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+  return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+REGISTRY = Registry()
+
+def enable():
+  _state["enabled"] = True
+
+def disable():
+  _state["enabled"] = False
+
+def is_enabled():
+  return _state["enabled"]
+
+def observe(name, value, **labels):
+  if _state["enabled"]:
+    REGISTRY.observe(name, value, labels)
+
+def set_gauge(name, value, **labels):
+  if _state["enabled"]:
+    REGISTRY.set_gauge(name, value, labels)
+
+class _Timer():
+  __slots__ = ("name", "labels", "start")
+
+  def __init__(self, name, labels):
+    self.name = name
+    self.labels = labels
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc):
+    REGISTRY.observe(self.name, time.perf_counter() - self.start, self.labels)
+    return False
+
+def timer(name, **labels):
+  # with timer("squad_stage_seconds", stage="forward"): ...
+  return _Timer(name, labels) if _state["enabled"] else _NULL_TIMER
+
+def render():
+  return REGISTRY.render()
+
+class SamplingProfiler():
+  # Wall-clock sampling profiler: every `interval` seconds a background thread records the stack
+  # of every other thread. collapsed() returns "frame;frame;frame count" lines that flamegraph
+  # tools read directly. Costs nothing until start() is called.
+  def __init__(self, interval=0.005, max_depth=64):
+    self.interval = interval
+    self.max_depth = max_depth
+    self.samples = Counter()
+    self.thread = None
+    self.stopping = threading.Event()
+
+  def start(self):
+    if self.thread is None:
+      self.stopping.clear()
+      self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+      self.thread.start()
+
+  def stop(self):
+    if self.thread is not None:
+      self.stopping.set()
+      self.thread.join()
+      self.thread = None
+
+  def is_running(self):
+    return self.thread is not None
+
+  def _run(self):
+    own = threading.get_ident()
+    while not self.stopping.wait(self.interval):
+      for thread_id, frame in sys._current_frames().items():
+        if thread_id == own:
+          continue
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+          code = frame.f_code
+          stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+          frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+  def collapsed(self):
+    return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+  def clear(self):
+    self.samples.clear()
+
+profiler = SamplingProfiler()
@@ -0,0 +1,35 @@
+import numpy as np
+
+# Percentile lookups against a background population.
+# The population is kept as a sorted array so a whole batch of queries is answered with
+# one np.searchsorted call (O(N log M) instead of O(N * M)).
+# New members go into a small sorted side buffer that is merged into the main array once it
+# grows past `merge_threshold`; merging is a linear insert of two sorted arrays, never a re-sort.
+
+class PercentileIndex():
+  def __init__(self, values, merge_threshold=1024):
+    self.values = np.sort(np.asarray(values, dtype=np.float64).ravel())
+    self.pending = np.zeros(0, dtype=np.float64)
+    self.merge_threshold = merge_threshold
+
+  def __len__(self):
+    return len(self.values) + len(self.pending)
+
+  def insert(self, new_values):
+    new_values = np.sort(np.asarray(new_values, dtype=np.float64).ravel())
+    self.pending = np.insert(self.pending, np.searchsorted(self.pending, new_values), new_values)
+    if len(self.pending) >= self.merge_threshold:
+      self.merge()
+
+  def merge(self):
+    if len(self.pending):
+      self.values = np.insert(self.values, np.searchsorted(self.values, self.pending), self.pending)
+      self.pending = np.zeros(0, dtype=np.float64)
+
+  def percentile(self, queries):
+    # fraction of the population <= each query (same as np.sum(query >= population) / len(population))
+    queries = np.asarray(queries, dtype=np.float64)
+    counts = np.searchsorted(self.values, queries, side="right")
+    if len(self.pending):
+      counts = counts + np.searchsorted(self.pending, queries, side="right")
+    return counts / len(self)
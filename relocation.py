@@ -0,0 +1,116 @@
+import numpy as np
+
+# Relocation planner.
+# Soldiers below the health threshold at a target location are replaced by healthy soldiers
+# from other locations, minimising the total squared distance the replacements travel.
+# The output is a list of tuples (person_a, person_b), where person_a is the person to be
+# replaced and person_b is the person replacing them, plus the total cost.
+
+def squared_distances(targets, locations):
+  # (T, 2) x (H, 2) -> (T, H) squared euclidean distances via broadcasting
+  diff = np.asarray(targets, dtype=np.float64)[:, None, :] - np.asarray(locations, dtype=np.float64)[None, :, :]
+  return (diff ** 2).sum(axis=2)
+
+def _apply_capacity(healthy, locations, capacity):
+  # keep at most `capacity` donors per location; donors at one location all cost the same,
+  # so truncating each location's list loses nothing
+  if capacity is None:
+    return healthy
+  keep = []
+  taken = {}
+  for idx in healthy:
+    loc = tuple(locations[idx])
+    limit = capacity.get(loc, np.inf) if isinstance(capacity, dict) else capacity
+    if taken.get(loc, 0) < limit:
+      taken[loc] = taken.get(loc, 0) + 1
+      keep.append(idx)
+  return np.array(keep, dtype=np.int64)
+
+def _greedy_kdtree(slot_targets, targets, healthy_locations):
+  # nearest unused donor for each slot, using a KD-tree instead of a full cost matrix
+  from scipy.spatial import cKDTree
+  tree = cKDTree(healthy_locations)
+  used = np.zeros(len(healthy_locations), dtype=bool)
+  rows, cols = [], []
+  for row, t in enumerate(slot_targets):
+    if used.all():
+      break
+    k = 8
+    while True:
+      _, idx = tree.query(targets[t], k=min(k, len(healthy_locations)))
+      idx = np.atleast_1d(idx)
+      free = idx[~used[idx]]
+      if len(free) or k >= len(healthy_locations):
+        break
+      k *= 4
+    rows.append(row)
+    cols.append(free[0])
+    used[free[0]] = True
+  return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
+def _select(graph_data, targets, threshold, capacity):
+  # full scan: below-threshold soldiers at the targets and every eligible donor
+  target_index = {t: i for i, t in enumerate(targets)}
+  people = list(graph_data)
+  locations = np.array([graph_data[p]["location"] for p in people], dtype=np.float64).reshape(-1, 2)
+  health = np.array([graph_data[p]["health"] for p in people], dtype=np.float64)
+  at_target = np.array([target_index.get(tuple(graph_data[p]["location"]), -1) for p in people], dtype=np.int64)
+  below = np.nonzero((at_target >= 0) & (health < threshold))[0]
+  healthy = _apply_capacity(np.nonzero((at_target < 0) & (health >= threshold))[0], locations, capacity)
+  return ([people[i] for i in below], at_target[below],
+          [people[i] for i in healthy], locations[healthy])
+
+def _select_from_index(index, targets, threshold):
+  # index-backed: only the soldiers at the targets and each target's nearest healthy donors.
+  # An optimal assignment never uses a donor that is not among the (number of slots) closest
+  # donors to the target it fills, so this candidate set loses nothing.
+  below, slot_targets = [], []
+  for t, target in enumerate(targets):
+    for person in sorted(index.at_location(target), key=str):
+      if index.health[person] < threshold:
+        below.append(person)
+        slot_targets.append(t)
+  donors = {}
+  exclude = set(targets)
+  for target in targets:
+    for person, _ in index.nearest(target, len(below), min_health=threshold, exclude_locations=exclude):
+      donors[person] = index.location[person]
+  return (below, np.array(slot_targets, dtype=np.int64),
+          list(donors), np.array(list(donors.values()), dtype=np.float64).reshape(-1, 2))
+
+def plan_relocation(graph_data, location_target, threshold, capacity=None, max_matrix_size=4_000_000, index=None):
+  # graph_data: {person: {"location": [x, y], "health": h}}
+  # location_target: one (x, y) or a list of them
+  # capacity: max donors per location, as an int or {(x, y): int}
+  # max_matrix_size: above this many cost-matrix cells, fall back to greedy KD-tree matching
+  # index: optional SpatialIndex over graph_data, used to avoid scanning every soldier
+  targets = [tuple(location_target)] if np.isscalar(location_target[0]) else [tuple(t) for t in location_target]
+  # a repeated target would turn each of its soldiers into several slots
+  targets = list(dict.fromkeys(targets))
+  if index is not None and capacity is None:
+    below, slot_targets, donors, donor_locations = _select_from_index(index, targets, threshold)
+  else:
+    below, slot_targets, donors, donor_locations = _select(graph_data, targets, threshold, capacity)
+  if len(below) == 0 or len(donors) == 0:
+    return [], 0
+
+  target_locations = np.array(targets, dtype=np.float64)
+  if len(targets) == 1:
+    # every slot costs the same per donor, so the optimal assignment is simply the closest donors
+    costs = squared_distances(target_locations, donor_locations)[0]
+    n = min(len(below), len(donors))
+    cols = np.argpartition(costs, n - 1)[:n] if n < len(donors) else np.arange(n)
+    cols = cols[np.argsort(costs[cols], kind="stable")]
+    rows = np.arange(n)
+    slot_costs = costs[cols]
+  elif len(below) * len(donors) <= max_matrix_size:
+    from scipy.optimize import linear_sum_assignment
+    cost_matrix = squared_distances(target_locations, donor_locations)[slot_targets]
+    rows, cols = linear_sum_assignment(cost_matrix)
+    slot_costs = cost_matrix[rows, cols]
+  else:
+    rows, cols = _greedy_kdtree(slot_targets, target_locations, donor_locations)
+    slot_costs = ((donor_locations[cols] - target_locations[slot_targets[rows]]) ** 2).sum(axis=1)
+
+  relocation_plan = [(below[r], donors[c]) for r, c in zip(rows, cols)]
+  return relocation_plan, slot_costs.sum().item()
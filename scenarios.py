@@ -0,0 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+
+import numpy as np
+
+from relocation import squared_distances
+
+# What-if engine for cohort relocation.
+# A scenario is (cohort IDs, target location, threshold): the cohort is deployed to the target
+# and every member whose health is below the threshold is replaced by the closest healthy
+# soldier from another location (a single target, so the minimum-cost assignment is simply the
+# nearest eligible donors, as in relocation.plan_relocation). Health comes from the monitor's
+# cached squad predictions, the squared distances from every distinct soldier location to every
+# distinct target are computed once in one matrix, and each target's donor order is sorted once
+# and shared by all scenarios aimed at it. Scenarios are evaluated in a thread pool and returned
+# as one ranked DataFrame.
+
+def scenario_grid(cohorts, targets, thresholds):
+  # every (cohort, target, threshold) combination
+  return [(list(cohort), tuple(target), threshold) for cohort, target, threshold in product(cohorts, targets, thresholds)]
+
+class ScenarioEngine():
+  def __init__(self, monitor, locations, health=None, max_workers=4):
+    # locations: {ID: (x, y)} or graph_data-style {ID: {"location": [x, y], ...}} for every squad soldier
+    # health: optional per-soldier scores (array in soldier_IDs order or {ID: score}); defaults to the
+    # health percentiles of the monitor's cached squad predictions, as optimize_cohort2 uses
+    self.monitor = monitor
+    self.soldier_IDs = list(monitor.soldier_IDs)
+    self.rows = {ID: i for i, ID in enumerate(self.soldier_IDs)}
+    points = [locations[ID]["location"] if isinstance(locations[ID], dict) else locations[ID] for ID in self.soldier_IDs]
+    self.unique_locations, self.location_idx = np.unique(np.asarray(points, dtype=np.float64).reshape(-1, 2),
+                                                         axis=0, return_inverse=True)
+    self.location_idx = self.location_idx.ravel()
+    if health is None:
+      health = monitor.health_index.percentile(monitor.squad_probs[:,2])
+    elif isinstance(health, dict):
+      health = [health[ID] for ID in self.soldier_IDs]
+    self.health = np.asarray(health, dtype=np.float64)
+    self.max_workers = max_workers
+
+  def _targets(self, targets):
+    # shared (targets, soldiers) squared distances and each target's soldiers sorted nearest first
+    targets = list(dict.fromkeys(tuple(target) for target in targets))
+    distances = squared_distances(np.array(targets, dtype=np.float64), self.unique_locations)[:, self.location_idx]
+    order = np.argsort(distances, axis=1, kind="stable")
+    return {target: (distances[t], order[t]) for t, target in enumerate(targets)}
+
+  def _evaluate(self, scenario, target_state):
+    cohort, target, threshold = scenario
+    distances, order = target_state[tuple(target)]
+    cohort_rows = np.array([self.rows[ID] for ID in cohort], dtype=np.int64)
+    cohort_health = self.health[cohort_rows]
+    below = cohort_rows[cohort_health < threshold]
+    # donors: healthy, outside the cohort and not already stationed at the target
+    eligible = (self.health >= threshold) & (distances > 0)
+    eligible[cohort_rows] = False
+    donors = order[eligible[order]][:len(below)]
+    replaced = below[:len(donors)]
+    health_after = cohort_health.copy()
+    health_after[np.isin(cohort_rows, replaced)] = self.health[donors]
+    return {"cohort": list(cohort),
+            "target": tuple(target),
+            "threshold": threshold,
+            "cohort_size": len(cohort_rows),
+            "num_below": len(below),
+            "num_replaced": len(donors),
+            "unfilled": len(below) - len(donors),
+            "total_cost": float(distances[donors].sum()),
+            "cohort_health_before": float(cohort_health.mean()) if len(cohort_rows) else np.nan,
+            "cohort_health_after": float(health_after.mean()) if len(cohort_rows) else np.nan,
+            "min_health_after": float(health_after.min()) if len(cohort_rows) else np.nan,
+            "relocation_plan": [(self.soldier_IDs[a], self.soldier_IDs[b]) for a, b in zip(replaced, donors)]}
+
+  def evaluate(self, scenarios, sort_by=("unfilled", "cohort_health_after", "total_cost"), ascending=(True, False, True)):
+    # scenarios: list of (cohort IDs, target (x, y), threshold) -> DataFrame, best scenario first
+    import pandas as pd
+    scenarios = list(scenarios)
+    if not scenarios:
+      return pd.DataFrame()
+    target_state = self._targets(target for _, target, _ in scenarios)
+    if self.max_workers and self.max_workers > 1 and len(scenarios) > 1:
+      with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+        rows = list(pool.map(lambda scenario: self._evaluate(scenario, target_state), scenarios))
+    else:
+      rows = [self._evaluate(scenario, target_state) for scenario in scenarios]
+    table = pd.DataFrame(rows)
+    table.index.name = "scenario"
+    table = table.sort_values(list(sort_by), ascending=list(ascending), kind="stable")
+    table.insert(0, "rank", np.arange(1, len(table) + 1))
+    return table
@@ -0,0 +1,178 @@
+import io
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from activity import vm_range
+
+# Multi-core execution of the per-soldier SquadMonitor stages.
+# Signals are packed once into a single shared-memory (num_features, total_timesteps) buffer with
+# per-soldier offsets; workers attach to it and slice zero-copy views, so only offsets and IDs
+# are pickled per shard. Each worker holds a stripped-down SquadMonitor (models and settings, no
+# squad data) and computes heart metrics, VM ranges and class probabilities for its shard of
+# soldiers. Percentile lookups stay in the parent, against the monitor's current background
+# indexes, and results are merged back in the original soldier_IDs order.
+# Workers are forked on POSIX, so they inherit the model (and its class) from the parent. With
+# spawn / forkserver the model is sent as TorchScript, so workers can rebuild it even when its class
+# only exists in a notebook's __main__; a model that cannot be scripted, or the compile / quantized
+# backends, are sent pickled and then need an importable model class. CUDA models need spawn.
+
+# attributes a worker needs to run the per-soldier stages, besides the model
+WORKER_ATTRIBUTES = ["signal_feature_names", "metadata_feature_names", "green_idx", "acc_idx", "device",
+                     "batch_size", "sample_rate", "activity_chunk_size", "model_info", "disease_classifier",
+                     "label_encoder", "length_buckets", "max_batch_tokens", "bucket_granularity"]
+
+_worker = {}
+
+def default_start_method():
+  return "fork" if sys.platform != "win32" and "fork" in multiprocessing.get_all_start_methods() else "spawn"
+
+def _model_payload(model, inference_kind, start_method):
+  # ("module", model) for forked workers or models that must stay nn.Modules, else TorchScript bytes
+  if start_method == "fork" or inference_kind in ("compile", "quantized"):
+    return "module", model
+  import torch
+  try:
+    scripted = torch.jit.script(model)
+  except Exception as error:
+    unimportable = _unimportable_classes(model)
+    if unimportable:
+      raise ValueError(f"cannot send the model to {start_method} workers: it does not compile to TorchScript ({error}) "
+                       f"and {', '.join(unimportable)} cannot be imported by a new process; use start_method='fork' "
+                       "or define the model class in a module") from error
+    return "module", model
+  buffer = io.BytesIO()
+  torch.jit.save(scripted, buffer)
+  return "torchscript", buffer.getvalue()
+
+def _unimportable_classes(model):
+  # module classes a spawned process could not import to unpickle the model
+  names = set()
+  for module in model.modules():
+    cls = type(module)
+    main = sys.modules.get(cls.__module__)
+    # a spawned child re-imports __main__ only from a real file (not from a notebook or stdin)
+    if "<locals>" in cls.__qualname__ or (cls.__module__ == "__main__" and not os.path.isfile(getattr(main, "__file__", None) or "")):
+      names.add(cls.__qualname__)
+  return sorted(names)
+
+def _init_worker(state, model_payload, inference_kind, num_threads):
+  from inference import InferenceBackend
+  from squad_monitor import SquadMonitor
+  monitor = object.__new__(SquadMonitor)
+  monitor.__dict__.update(state)
+  kind, model = model_payload
+  if kind == "torchscript":
+    import torch
+    model = torch.jit.load(io.BytesIO(model), map_location=monitor.device)
+  monitor.model = model
+  monitor.inference = InferenceBackend(monitor.model, inference_kind, monitor.device, num_threads)
+  _worker["monitor"] = monitor
+
+def _run_shard(shm_name, shape, dtype, offsets, soldier_IDs, metadata, with_heart, with_movement, with_health):
+  monitor = _worker["monitor"]
+  shm = shared_memory.SharedMemory(name=shm_name)
+  try:
+    packed = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    signals = [packed[:, offsets[i]:offsets[i + 1]] for i in range(len(soldier_IDs))]
+    result = {}
+    if with_heart:
+      result["heart"] = monitor.generate_heart_metrics(signals, soldier_IDs)
+    if with_movement:
+      result["vm_range"] = vm_range(signals, monitor.acc_idx, monitor.activity_chunk_size)
+    if with_health:
+      if metadata is None:
+        metadata = monitor.generate_metadata(signals, soldier_IDs).values
+      probs = monitor.disease_classifier.predict_proba(metadata)
+      result["probs"] = probs
+      result["outcomes"] = monitor.outcomes_from_probs(probs)
+    # drop every view into the shared buffer before closing it
+    del signals, packed
+    return result
+  finally:
+    shm.close()
+
+def pack_signals(signals, dtype=np.float32):
+  # ragged (num_features, num_timesteps) signals -> one shared (num_features, total) buffer + offsets
+  lengths = np.fromiter((len(seq[0]) for seq in signals), dtype=np.int64, count=len(signals))
+  offsets = np.concatenate([[0], np.cumsum(lengths)])
+  num_features = len(signals[0]) if len(signals) else 0
+  shape = (num_features, max(int(offsets[-1]), 1))
+  shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+  packed = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+  for i, seq in enumerate(signals):
+    for c in range(num_features):
+      packed[c, offsets[i]:offsets[i + 1]] = seq[c]
+  del packed
+  return shm, shape, offsets
+
+class ShardedSquadRunner():
+  def __init__(self, monitor, num_workers=None, shard_size=None, start_method=None, threads_per_worker=1):
+    self.monitor = monitor
+    self.num_workers = num_workers or multiprocessing.cpu_count()
+    # default: a few shards per worker so stragglers even out
+    self.shard_size = shard_size
+    self.start_method = start_method or default_start_method()
+    self.threads_per_worker = threads_per_worker
+    self.pool = None
+
+  def _pool(self):
+    if self.pool is None:
+      state = {name: getattr(self.monitor, name) for name in WORKER_ATTRIBUTES}
+      kind = self.monitor.inference.kind
+      self.pool = ProcessPoolExecutor(max_workers=self.num_workers,
+                                      mp_context=multiprocessing.get_context(self.start_method),
+                                      initializer=_init_worker,
+                                      initargs=(state, _model_payload(self.monitor.model, kind, self.start_method),
+                                                kind, self.threads_per_worker))
+    return self.pool
+
+  def refresh(self):
+    # restart the workers, e.g. after monitor.reload_model
+    self.close()
+
+  def close(self):
+    if self.pool is not None:
+      self.pool.shutdown()
+      self.pool = None
+
+  def run(self, signals, soldier_IDs, metadata=None, heart=True, movement=True, health=True):
+    # returns {"heart": DataFrame, "movement": {ID: percentile}, "health": {ID: (outcome, percentile)}}
+    # like generate_heart_metrics / generate_movement_data / end_to_end (or generate_health_predictions
+    # when metadata is given), computed shard by shard in the worker pool
+    import pandas as pd
+    num_soldiers = len(soldier_IDs)
+    if num_soldiers == 0:
+      return {}
+    shard_size = self.shard_size or max(1, -(-num_soldiers // (4 * self.num_workers)))
+    metadata = None if metadata is None else np.asarray(metadata)
+    shm, shape, offsets = pack_signals(signals)
+    try:
+      starts = range(0, num_soldiers, shard_size)
+      jobs = [self._pool().submit(_run_shard, shm.name, shape, np.float32, offsets[s:s + shard_size + 1],
+                                  list(soldier_IDs[s:s + shard_size]),
+                                  None if metadata is None else metadata[s:s + shard_size],
+                                  heart, movement, health)
+              for s in starts]
+      shards = [job.result() for job in jobs]
+    finally:
+      shm.close()
+      shm.unlink()
+
+    monitor = self.monitor
+    results = {}
+    if heart:
+      results["heart"] = pd.concat([shard["heart"] for shard in shards])
+    if movement:
+      percentiles = monitor.activity_index.percentile(np.concatenate([shard["vm_range"] for shard in shards]))
+      results["movement"] = dict(zip(soldier_IDs, percentiles))
+    if health:
+      probs = np.concatenate([shard["probs"] for shard in shards])
+      outcomes = np.concatenate([shard["outcomes"] for shard in shards])
+      percentiles = monitor.health_index.percentile(probs[:, 2])
+      results["health"] = {ID: (outcomes[i], percentiles[i]) for i, ID in enumerate(soldier_IDs)}
+    return results
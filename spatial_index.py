@@ -0,0 +1,147 @@
+import math
+
+# Grid-bucket spatial index over soldier locations.
+# Soldiers are bucketed by the grid cell their location falls in, so k-nearest and radius
+# queries only visit the cells around the query point. Health and location updates move a
+# single soldier between buckets, so the index stays valid across repeated planning queries
+# without rebuilding it from graph_data.
+
+class SpatialIndex():
+  def __init__(self, graph_data=None, cell_size=1.0):
+    self.cell_size = cell_size
+    self.cells = {}  # (cx, cy) -> {location tuple: set of people}
+    self.location = {}  # person -> (x, y)
+    self.health = {}  # person -> health score
+    self._cached_bounds = None  # occupied cell range, recomputed only after a cell empties
+    for person, d in (graph_data or {}).items():
+      self.upsert(person, d["location"], d["health"])
+
+  def __len__(self):
+    return len(self.location)
+
+  def __contains__(self, person):
+    return person in self.location
+
+  def _cell(self, location):
+    return (math.floor(location[0] / self.cell_size), math.floor(location[1] / self.cell_size))
+
+  def _bounds(self):
+    if self._cached_bounds is None:
+      xs = [c[0] for c in self.cells]
+      ys = [c[1] for c in self.cells]
+      self._cached_bounds = (min(xs), max(xs), min(ys), max(ys))
+    return self._cached_bounds
+
+  def upsert(self, person, location=None, health=None):
+    # add a soldier or update their location and/or health
+    if health is not None:
+      self.health[person] = health
+    if location is None:
+      return
+    location = tuple(location)
+    old = self.location.get(person)
+    if old == location:
+      return
+    if old is not None:
+      self._discard(person, old)
+    self.location[person] = location
+    cell = self._cell(location)
+    if cell not in self.cells and self._cached_bounds is not None:
+      x_min, x_max, y_min, y_max = self._cached_bounds
+      self._cached_bounds = (min(x_min, cell[0]), max(x_max, cell[0]), min(y_min, cell[1]), max(y_max, cell[1]))
+    self.cells.setdefault(cell, {}).setdefault(location, set()).add(person)
+
+  def _discard(self, person, location):
+    cell = self._cell(location)
+    bucket = self.cells[cell]
+    bucket[location].discard(person)
+    if not bucket[location]:
+      del bucket[location]
+    if not bucket:
+      del self.cells[cell]
+      self._cached_bounds = None
+
+  def remove(self, person):
+    location = self.location.pop(person)
+    self.health.pop(person, None)
+    self._discard(person, location)
+
+  def at_location(self, location):
+    location = tuple(location)
+    return set(self.cells.get(self._cell(location), {}).get(location, ()))
+
+  def _ring(self, centre, r):
+    cx, cy = centre
+    if r == 0:
+      yield centre
+      return
+    for dx in range(-r, r + 1):
+      yield (cx + dx, cy - r)
+      yield (cx + dx, cy + r)
+    for dy in range(-r + 1, r):
+      yield (cx - r, cy + dy)
+      yield (cx + r, cy + dy)
+
+  def _matches(self, location, people, min_health, exclude_locations, per_location):
+    if exclude_locations and location in exclude_locations:
+      return []
+    if min_health is not None:
+      people = [p for p in people if self.health.get(p, -math.inf) >= min_health]
+    else:
+      people = list(people)
+    return people[:per_location] if per_location is not None else people
+
+  def nearest(self, point, k, min_health=None, exclude_locations=None, per_location=None):
+    # k closest soldiers to point as [(person, squared distance)], optionally only those with
+    # health >= min_health, outside exclude_locations, and at most per_location from any location
+    if not self.cells or k <= 0:
+      return []
+    point = tuple(point)
+    centre = self._cell(point)
+    x_min, x_max, y_min, y_max = self._bounds()
+    max_ring = max(abs(centre[0] - x_min), abs(centre[0] - x_max), abs(centre[1] - y_min), abs(centre[1] - y_max))
+    found = []
+    for r in range(max_ring + 1):
+      if 8 * r > len(self.cells):
+        # on a sparse grid the rings are mostly empty cells; once a ring is larger than the number
+        # of occupied cells, scan the occupied cells not covered yet and stop
+        cells = [cell for cell in self.cells if max(abs(cell[0] - centre[0]), abs(cell[1] - centre[1])) >= r]
+        max_ring = r
+      else:
+        cells = self._ring(centre, r)
+      for cell in cells:
+        for location, people in self.cells.get(cell, {}).items():
+          d = (location[0] - point[0]) ** 2 + (location[1] - point[1]) ** 2
+          found.extend((p, d) for p in self._matches(location, people, min_health, exclude_locations, per_location))
+      if r == max_ring:
+        break
+      # anything outside the rings scanned so far is at least r * cell_size away
+      if len(found) >= k:
+        found.sort(key=lambda item: (item[1], str(item[0])))
+        if found[k - 1][1] <= (r * self.cell_size) ** 2:
+          break
+    found.sort(key=lambda item: (item[1], str(item[0])))
+    return found[:k]
+
+  def within(self, point, radius, min_health=None, exclude_locations=None):
+    # all soldiers within radius of point as [(person, squared distance)], closest first
+    if not self.cells:
+      return []
+    point = tuple(point)
+    x_min, x_max, y_min, y_max = self._bounds()
+    x0, y0 = self._cell((point[0] - radius, point[1] - radius))
+    x1, y1 = self._cell((point[0] + radius, point[1] + radius))
+    x0, y0, x1, y1 = max(x0, x_min), max(y0, y_min), min(x1, x_max), min(y1, y_max)
+    if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+      # fewer occupied cells than cells in the box: filter the occupied ones instead
+      cells = [cell for cell in self.cells if x0 <= cell[0] <= x1 and y0 <= cell[1] <= y1]
+    else:
+      cells = [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+    found = []
+    for cell in cells:
+      for location, people in self.cells.get(cell, {}).items():
+        d = (location[0] - point[0]) ** 2 + (location[1] - point[1]) ** 2
+        if d <= radius ** 2:
+          found.extend((p, d) for p in self._matches(location, people, min_health, exclude_locations, None))
+    found.sort(key=lambda item: (item[1], str(item[0])))
+    return found
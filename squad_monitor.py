@@ -1,83 +1,253 @@
+from functools import cached_property
+
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import os
-import torch
-import torch.nn as nn
-import torch.nn.functional as F
-import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader, TensorDataset, random_split
-from sklearn.model_selection import train_test_split
-from scipy.signal import find_peaks
+
+# torch, pandas, lime and the plotting libraries are imported where they are used, so a worker
+# process can import this module and load a snapshot without paying for all of them up front
+from batching import sequence_lengths, pad_sequences, padding_mask, length_buckets
+from heart_metrics import hrv_metrics
+from percentile_index import PercentileIndex
+from activity import vm_range
+from relocation import plan_relocation
+from inference import InferenceBackend
+from instrumentation import timer, observe
+from explanations import BatchExplainer, is_linear, linear_contributions, contributions_as_map
 
 class SquadMonitor():
   def __init__(self, squad_signals, squad_metadata, soldier_IDs,
                signal_feature_names, metadata_feature_names, model, device, model_info, disease_classifier, label_encoder,
-               lime_training_data):
+               lime_training_data, batch_size=256, sample_rate=25, activity_chunk_size=1024, explain_workers=None,
+               lazy=False, snapshot=None, inference_backend="eager", num_threads=None,
+               length_buckets=False, max_batch_tokens=None, bucket_granularity=32):
     self.squad_signals = squad_signals
     self.squad_metadata = squad_metadata
     self.soldier_IDs = soldier_IDs
     self.signal_feature_names = signal_feature_names
     self.metadata_feature_names = metadata_feature_names
+    # feature indices resolved once
+    self.green_idx = self.signal_feature_names.index("green")
+    self.acc_idx = [self.signal_feature_names.index(name) for name in ["acc_x", "acc_y", "acc_z"]]
     # "model" is a trained model that generates metadata predictions from raw signals
-    self.model = model.to(device)
+    self.model = model.to(device).eval()
     self.device = device
+    # how the metadata model is executed: eager, torchscript, compile or quantized (see inference.py)
+    self.inference = InferenceBackend(self.model, inference_backend, device, num_threads)
+    # number of soldiers per forward pass in generate_metadata
+    self.batch_size = batch_size
+    # pad each batch only to its own longest sequence instead of max_time. Opt-in: the model
+    # pools over padded positions, so outputs depend on how much padding a sequence gets.
+    self.length_buckets = length_buckets
+    # padded timesteps per forward pass when bucketing (default: batch_size * max_time)
+    self.max_batch_tokens = max_batch_tokens
+    self.bucket_granularity = bucket_granularity
+    # signal sampling rate in Hz (~1500 timesteps per minute)
+    self.sample_rate = sample_rate
+    # soldiers padded at once when computing activity, bounds memory for long recordings
+    self.activity_chunk_size = activity_chunk_size
 
     # contains :
     # - maximum time steps that the model was trained on
     # - metadata mean per feature
     # - metadata std per feature
     self.model_info = model_info
+    if snapshot is not None:
+      # background distributions, squad predictions and model_info computed by save_snapshot
+      self.load_snapshot(snapshot)
 
     # trained logistic regression that predicts ["afib", "regular", "irregular"] from metadata
     self.disease_classifier = disease_classifier
     # fitted label encoder that maps from outcome to label encoding
     self.label_encoder = label_encoder
 
-    self.explainer = lime_tabular.LimeTabularExplainer(
-      training_data=lime_training_data,
+    self.lime_training_data = lime_training_data
+    self.explain_workers = explain_workers
+    # training means anchor the closed-form contributions of a linear classifier
+    self.feature_means = np.asarray(lime_training_data, dtype=np.float64).mean(axis=0)
+    self.squad_rows = {ID: i for i, ID in enumerate(self.soldier_IDs)}
+
+    # the explainer, squad predictions, background distributions and percentile indexes are
+    # cached properties; lazy=True builds each one on first use instead of here
+    if not lazy:
+      self.warm_up()
+
+  def warm_up(self):
+    for name in ["explainer", "batch_explainer", "squad_probs", "squad_outcomes", "activity_index", "health_index"]:
+      getattr(self, name)
+
+  @cached_property
+  def explainer(self):
+    from lime import lime_tabular
+    return lime_tabular.LimeTabularExplainer(
+      training_data=self.lime_training_data,
       feature_names=self.metadata_feature_names,
       class_names=["afib", "irregular", "regular"],
       mode="classification"
     )
 
-    self.activity_distribution = np.array(self.generate_background_activity())
-    self.health_distribution = self.generate_background_health()
+  # shares LIME sampling and classifier calls across soldiers, with memoized results
+  @cached_property
+  def batch_explainer(self):
+    return BatchExplainer(self.explainer, self.disease_classifier.predict_proba, num_workers=self.explain_workers)
+
+  # squad predictions are cached per soldier and refreshed only by update_soldier_metadata
+  @cached_property
+  def squad_probs(self):
+    return self.disease_classifier.predict_proba(self.squad_metadata)
+
+  @cached_property
+  def squad_outcomes(self):
+    return self.outcomes_from_probs(self.squad_probs).astype(object)
+
+  @cached_property
+  def activity_distribution(self):
+    return self.generate_background_activity()
+
+  @cached_property
+  def health_distribution(self):
+    return self.generate_background_health()
+
+  # sorted indexes over the background distributions for batched percentile lookups
+  @cached_property
+  def activity_index(self):
+    return PercentileIndex(self.activity_distribution)
+
+  @cached_property
+  def health_index(self):
+    return PercentileIndex(self.health_distribution)
+
+  # everything a cold worker needs besides the models themselves, in one .npz file
+  def save_snapshot(self, path):
+    self.activity_index.merge()
+    self.health_index.merge()
+    np.savez(path,
+             activity_distribution=self.activity_index.values,
+             health_distribution=self.health_index.values,
+             squad_probs=self.squad_probs,
+             # stored as strings, so integer and string IDs compare the same way on load
+             soldier_IDs=np.asarray([str(ID) for ID in self.soldier_IDs], dtype=str),
+             max_time=self.model_info["max_time"],
+             metadata_mean=self.model_info["metadata_mean"],
+             metadata_std=self.model_info["metadata_std"])
+
+  def load_snapshot(self, path):
+    with np.load(path) as snapshot:
+      self.model_info = {"max_time": int(snapshot["max_time"]),
+                         "metadata_mean": snapshot["metadata_mean"],
+                         "metadata_std": snapshot["metadata_std"]}
+      self.activity_distribution = snapshot["activity_distribution"]
+      self.health_distribution = snapshot["health_distribution"]
+      # squad predictions are only valid for the squad they were computed on
+      if snapshot["soldier_IDs"].tolist() == [str(ID) for ID in self.soldier_IDs]:
+        self.squad_probs = snapshot["squad_probs"]
+    for name in ["activity_index", "health_index", "squad_outcomes"]:
+      self.__dict__.pop(name, None)
+
+  # swap in new models without rebuilding the monitor; only caches that depend on a replaced
+  # model are dropped (and rebuilt lazily)
+  def reload_model(self, model=None, model_info=None, disease_classifier=None, label_encoder=None):
+    if model is not None:
+      self.model = model.to(self.device).eval()
+      self.inference = InferenceBackend(self.model, self.inference.kind, self.device, self.inference.num_threads)
+    if model_info is not None:
+      self.model_info = model_info
+    if disease_classifier is not None:
+      self.disease_classifier = disease_classifier
+      for name in ["batch_explainer", "squad_probs", "squad_outcomes", "health_distribution", "health_index"]:
+        self.__dict__.pop(name, None)
+    if label_encoder is not None:
+      self.label_encoder = label_encoder
+      self.__dict__.pop("squad_outcomes", None)
 
   def generate_background_activity(self):
-    temp = []
-    for signal in self.squad_signals:
-      acc_x = signal[self.signal_feature_names.index("acc_x")]
-      acc_y = signal[self.signal_feature_names.index("acc_y")]
-      acc_z = signal[self.signal_feature_names.index("acc_z")]
-      VM = (acc_x ** 2 + acc_y ** 2 + acc_z ** 2) ** 0.5
-      temp.append(max(VM) - min(VM))
-    return temp
+    return vm_range(self.squad_signals, self.acc_idx, self.activity_chunk_size)
 
   def generate_background_health(self):
-    return self.disease_classifier.predict_proba(self.squad_metadata)[:,2]
+    return self.squad_probs[:,2].copy()
+
+  # class labels from predict_proba output, the same labels predict() would return
+  def outcomes_from_probs(self, probs):
+    return self.label_encoder.inverse_transform(self.disease_classifier.classes_[probs.argmax(axis=1)])
+
+  # replace one soldier's metadata and re-classify only that soldier
+  def update_soldier_metadata(self, soldier_ID, metadata_row):
+    import pandas as pd
+    i = self.squad_rows[soldier_ID]
+    metadata_row = np.asarray(metadata_row).reshape(1, -1)
+    if isinstance(self.squad_metadata, pd.DataFrame):
+      self.squad_metadata.iloc[i] = metadata_row[0]
+    else:
+      self.squad_metadata[i] = metadata_row[0]
+    self.squad_probs[i] = self.disease_classifier.predict_proba(metadata_row)[0]
+    self.squad_outcomes[i] = self.outcomes_from_probs(self.squad_probs[i:i + 1])[0]
+
+  # cached health predictions for the squad, in the format of generate_health_predictions
+  def squad_predictions(self):
+    percentiles = self.health_index.percentile(self.squad_probs[:,2])
+    return {ID: (self.squad_outcomes[i], percentiles[i]) for i, ID in enumerate(self.soldier_IDs)}
+
+  # add new soldiers to the background populations without rebuilding the percentile indexes
+  def add_to_background(self, signals=None, metadata=None):
+    if signals is not None:
+      self.activity_index.insert(vm_range(signals, self.acc_idx, self.activity_chunk_size))
+    if metadata is not None:
+      self.health_index.insert(self.disease_classifier.predict_proba(metadata)[:,2])
+
+  # switch how the metadata model runs; with check_sequences the new backend is compared against the
+  # eager model first and only installed if it agrees within tolerance
+  def set_inference_backend(self, kind, num_threads=None, check_sequences=None, atol=1e-3):
+    import torch
+    backend = InferenceBackend(self.model, kind, self.device, num_threads)
+    if check_sequences is not None:
+      max_time = self.model_info["max_time"]
+      padded_sequences, lengths = pad_sequences(check_sequences, max_time)
+      backend.check_consistency(torch.from_numpy(padded_sequences), torch.from_numpy(padding_mask(lengths, max_time)), atol=atol)
+    self.inference = backend
+    return backend
 
   # Generate_metadata for sequences (list of num_features, num_timesteps numpy arrays)
   def generate_metadata(self, sequences, soldier_IDs):
-    padded_sequences = []
-    masks = []
-    for seq in sequences:
-      seq_tensor = torch.tensor(seq, dtype=torch.float32)  # Convert numpy array to tensor
-      pad_length = self.model_info["max_time"] - seq_tensor.shape[1]
-      padded_seq = F.pad(seq_tensor, (0, pad_length), "constant", 0)
-      mask = torch.zeros(self.model_info["max_time"], dtype=torch.bool)
-      mask[seq_tensor.shape[1]:] = True  # Mask padded positions
-      padded_sequences.append(padded_seq)
-      masks.append(mask)
-    padded_sequences = torch.tensor(padded_sequences, dtype=torch.float32).to(self.device)
-    masks = torch.tensor(masks, dtype=torch.float32).to(self.device)
-    outputs = model(padded_sequences, masks)
-    outputs = outputs.cpu().detach().numpy()
+    import pandas as pd
+    import torch
+    max_time = self.model_info["max_time"]
+    outputs = np.empty((len(sequences), len(self.metadata_feature_names)), dtype=np.float32)
+    if self.length_buckets:
+      # batches of similar length, results written back in the original soldier_IDs order
+      max_tokens = self.max_batch_tokens or self.batch_size * max_time
+      for indices, pad_time in length_buckets(sequence_lengths(sequences), max_time, max_tokens, self.bucket_granularity):
+        with timer("squad_stage_seconds", stage="pad"):
+          padded_sequences, lengths = pad_sequences([sequences[i] for i in indices], pad_time)
+          masks = padding_mask(lengths, pad_time)
+        outputs[indices] = self._forward(torch.from_numpy(padded_sequences), torch.from_numpy(masks))
+    else:
+      with timer("squad_stage_seconds", stage="pad"):
+        padded_sequences, lengths = pad_sequences(sequences, max_time)
+        masks = padding_mask(lengths, max_time)  # True at padded positions
+      padded_sequences = torch.from_numpy(padded_sequences)
+      masks = torch.from_numpy(masks)
+
+      # run the model in micro-batches so memory stays bounded for large squads
+      for start in range(0, len(sequences), self.batch_size):
+        end = start + self.batch_size
+        outputs[start:end] = self._forward(padded_sequences[start:end], masks[start:end])
 
     # un-normalize
-    outputs = outputs * self.model_info["metadata_std"] + self.model_info["metadata_mean"]
+    with timer("squad_stage_seconds", stage="unnormalize"):
+      outputs = outputs * self.model_info["metadata_std"] + self.model_info["metadata_mean"]
     return pd.DataFrame(outputs, columns=self.metadata_feature_names, index=soldier_IDs)
 
+  def _forward(self, x, mask):
+    observe("squad_batch_size", len(x), stage="forward")
+    observe("squad_tensor_bytes", x.element_size() * x.nelement(), stage="forward")
+    with timer("squad_stage_seconds", stage="forward"):
+      return self.inference(x, mask)
+
+  # signal windows for soldier_IDs read from a SampleStore; each window is a list of memory-mapped
+  # channels, which generate_metadata / generate_heart_metrics / generate_movement_data accept directly
+  def load_signals(self, store, soldier_IDs, start=None, stop=None, last=None):
+    if start is None and stop is None and last is None:
+      last = self.model_info["max_time"]
+    return [store.read_window(ID, self.signal_feature_names, start=start, stop=stop, last=last) for ID in soldier_IDs]
+
   def visualize_one_metadata(self, one_soldier_metadata):
     # can do some percentile stuff on the front end
     pass
@@ -87,59 +257,37 @@ class SquadMonitor():
     pass
 
   def generate_heart_metrics(self, sequences, soldier_IDs):
+    import pandas as pd
     # heart rate
     # mean RR interval
     # std of RR intervals
     # RMS of successive differences (SD)
-
-    interval = 40e-3 # hard-coded 40 millisecond interval because ~1500 timesteps per minute
-
-    green_idx = self.signal_feature_names.index("green")
-    heart_rates = []
-    mean_RRs = []
-    std_RRs = []
-    RMSSDs = []
-    for seq, id in zip(sequences, soldier_IDs):
-      peaks, _ = find_peaks(seq[green_idx], height=0)
-      bpm = []
-      for i in range(len(peaks)):
-        bpm.append(1500 / peaks[i] * i)
-      bpm = bpm[peaks[0]:]
-      heart_rates.append(bpm)
-      RR_intervals = np.diff(peaks) * interval
-      mean_RRs.append(np.mean(RR_intervals))
-      std_RRs.append(np.std(RR_intervals))
-      RMSSDs.append(np.mean(np.diff(RR_intervals) ** 2) ** 0.5)
-    return pd.DataFrame({"Heart Rate": heart_rates,
-                         "Mean RR Interval": mean_RRs,
-                         "SDNN": std_RRs,
-                         "RMSSD": RMSSDs}, index=soldier_IDs)
+    green, lengths = pad_sequences(sequences, channels=[self.green_idx])
+    metrics = hrv_metrics(green[:, 0], lengths, self.sample_rate)
+    return pd.DataFrame({"Heart Rate": metrics["heart_rate"],
+                         "Mean RR Interval": metrics["mean_rr"],
+                         "SDNN": metrics["sdnn"],
+                         "RMSSD": metrics["rmssd"]}, index=soldier_IDs)
 
   def generate_health_predictions(self, metadata, soldier_IDs):
     if len(metadata) == 1:
       metadata = metadata.reshape(1,-1)
-    outputs = self.disease_classifier.predict(metadata)
-    probs = self.disease_classifier.predict_proba(metadata)[:,2]
-    outputs = self.label_encoder.inverse_transform(outputs)
-    percentiles = []
-    for prob in probs:
-      percentiles.append(np.sum(prob >= self.health_distribution) / self.health_distribution.shape[0])
+    observe("squad_batch_size", len(metadata), stage="classify")
+    # a single classifier pass; labels are the argmax of the probabilities
+    with timer("squad_stage_seconds", stage="classify"):
+      probs = self.disease_classifier.predict_proba(metadata)
+      outputs = self.outcomes_from_probs(probs)
+    probs = probs[:,2]
+    with timer("squad_stage_seconds", stage="percentile"):
+      percentiles = self.health_index.percentile(probs)
     return {soldier_IDs[i]: (outputs[i], percentiles[i]) for i in range(len(soldier_IDs))}
 
   def generate_movement_data(self, signals, soldier_IDs):
-    VM_range_percentiles = []
-    for signal in signals:
-      acc_x = signal[self.signal_feature_names.index("acc_x")]
-      acc_y = signal[self.signal_feature_names.index("acc_y")]
-      acc_z = signal[self.signal_feature_names.index("acc_z")]
-      VM = (acc_x ** 2 + acc_y ** 2 + acc_z ** 2) ** 0.5
-      VM_range = max(VM) - min(VM)
-      VM_range_percentile = np.sum(VM_range >= self.activity_distribution) / self.activity_distribution.shape[0]
-      VM_range_percentiles.append(VM_range_percentile)
+    VM_ranges = vm_range(signals, self.acc_idx, self.activity_chunk_size)
+    VM_range_percentiles = self.activity_index.percentile(VM_ranges)
     return {soldier_IDs[i]: VM_range_percentiles[i] for i in range(len(soldier_IDs))}
     
   def optimize_cohort(self, cohort_metadata, cohort_IDs):
-    all_outcomes = self.generate_health_predictions(self.squad_metadata, self.soldier_IDs)
     cohort_outcomes = self.generate_health_predictions(cohort_metadata, cohort_IDs)
     self.visualize_cohort(cohort_outcomes)
 
@@ -150,7 +298,7 @@ class SquadMonitor():
 
     if num_irregular > 0 or num_afib > 0:
       self.alert_commander(num_irregular, num_afib)
-      healthy_replacements = [ID for ID, condition in all_outcomes.items() if condition[0] == "regular" and not ID in cohort_IDs]
+      healthy_replacements = [ID for ID, outcome in zip(self.soldier_IDs, self.squad_outcomes) if outcome == "regular" and not ID in cohort_IDs]
       sampled_replacements = np.random.choice(healthy_replacements, size=num_irregular + num_afib, replace=False)
       to_replace = [ID for ID, condition in cohort_outcomes.items() if condition[0] != "regular"]
       for i in to_replace:
@@ -161,7 +309,10 @@ class SquadMonitor():
     return cohort_IDs
   
   def optimize_cohort2(self, cohort_metadata, cohort_IDs):
-    all_outcomes = self.generate_health_predictions(self.squad_metadata, self.soldier_IDs)
+    import matplotlib.pyplot as plt
+    import networkx as nx
+    from pyvis.network import Network
+    all_outcomes = self.squad_predictions()
     location_ids = np.random.choice(list(range(len(self.soldier_IDs)//5)), size=len(self.soldier_IDs))
     locations_unique = [(int(1000*np.random.rand()), int(1000*np.random.rand())) for i in range(len(self.soldier_IDs)//5)]
     locations = [locations_unique[i] for i in location_ids]
@@ -173,31 +324,9 @@ class SquadMonitor():
     graph_data = {keys[i]:{"location":locations[i], "health":all_outcomes[keys[i]][1]} for i in range(len(keys))}
     location_target = locations_unique[0]
     threshold = 0.9
-    target_soldiers = {p: d for p, d in graph_data.items() if tuple(d["location"]) == location_target}
-    below_threshold = {p for p, d in target_soldiers.items() if d["health"] < threshold}
-
-    healthy_soldiers = {p: d for p, d in graph_data.items() if d["health"] >= threshold and tuple(d["location"]) != location_target}
-
-    def distance(loc1, loc2):
-        return (loc1[0] - loc2[0]) ** 2 + (loc1[1] - loc2[1]) ** 2
-
-    # Greedy algorithm which minimizes the distance that you would have to move healthy troops from other locations to get them to be at location_target
-    # The output should be a list of tuples (person_a, person_b), where person_a is the person to be replaced, and person_b is the person replacing them. 
-    total_cost = 0
-    relocation_plan = []
-    for soldier in below_threshold:
-        if not healthy_soldiers:
-            break  # No more healthy soldiers to move
-        
-        # Find the closest healthy soldier
-        closest_replacement = min(healthy_soldiers, key=lambda s: distance(tuple(healthy_soldiers[s]["location"]), location_target))
-        total_cost += distance(tuple(healthy_soldiers[closest_replacement]["location"]), location_target)
-        
-        # Record the move
-        relocation_plan.append((soldier, closest_replacement))
-        
-        # Remove the moved soldier from available replacements
-        del healthy_soldiers[closest_replacement]
+    # Minimum-cost assignment of healthy troops from other locations to replace those below threshold at location_target
+    # The output is a list of tuples (person_a, person_b), where person_a is the person to be replaced, and person_b is the person replacing them.
+    relocation_plan, total_cost = plan_relocation(graph_data, location_target, threshold)
 
     # Output the final relocation plan
     print(relocation_plan)
@@ -282,15 +411,45 @@ class SquadMonitor():
     # can do some front end thing
     pass
 
-  def explain_outcome(self, metadata_row):
+  def explain_outcome(self, metadata_row, show=True):
     exp = self.explainer.explain_instance(
       data_row=metadata_row,
       predict_fn=self.disease_classifier.predict_proba, num_features=len(self.metadata_feature_names))
     features = exp.as_map()
-    exp.show_in_notebook()
+    if show:
+      exp.show_in_notebook()
     # figure out visualization on front end
+    return features
+
+  # explanations for many soldiers at once: {soldier_ID: {label: [(feature index, weight), ...]}}
+  # method="auto" uses exact coefficient contributions when the classifier is linear and batched LIME otherwise
+  def explain_outcomes(self, metadata, soldier_IDs, labels=(1,), method="auto"):
+    if method not in ("auto", "linear", "lime"):
+      raise ValueError(f"unknown explanation method {method}")
+    metadata = np.asarray(metadata)
+    if method == "linear" or (method == "auto" and is_linear(self.disease_classifier)):
+      explanations = contributions_as_map(self.explain_contributions(metadata), labels=labels)
+    else:
+      explanations = self.batch_explainer.explain(metadata, labels=labels,
+                                                  num_features=len(self.metadata_feature_names))
+    return dict(zip(soldier_IDs, explanations))
+
+  # (N, classes, features) contributions of each metadata feature to each class's decision function
+  def explain_contributions(self, metadata):
+    return linear_contributions(self.disease_classifier, metadata, self.feature_means)
+
+  # multi-core runner for heart metrics, movement and health predictions (see sharding.py)
+  def sharded(self, num_workers=None, **kwargs):
+    from sharding import ShardedSquadRunner
+    return ShardedSquadRunner(self, num_workers, **kwargs)
+
+  # batched what-if evaluation of (cohort, target, threshold) relocation scenarios (see scenarios.py)
+  def scenario_engine(self, locations, **kwargs):
+    from scenarios import ScenarioEngine
+    return ScenarioEngine(self, locations, **kwargs)
 
   def end_to_end(self, signals, soldier_IDs):
-    predicted_metadata = self.generate_metadata(signals, soldier_IDs)
-    outcome_predictions = self.generate_health_predictions(predicted_metadata.values, soldier_IDs)
+    with timer("squad_stage_seconds", stage="end_to_end"):
+      predicted_metadata = self.generate_metadata(signals, soldier_IDs)
+      outcome_predictions = self.generate_health_predictions(predicted_metadata.values, soldier_IDs)
     return outcome_predictions
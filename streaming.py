@@ -0,0 +1,94 @@
+import numpy as np
+
+# Streaming front end for SquadMonitor.
+# Keeps a ring buffer of the latest `window` samples per soldier and only re-runs
+# metadata + health predictions for soldiers that received at least `hop` new samples
+# since their last emission, so a tick costs O(changed soldiers) instead of O(squad x window).
+
+class StreamingMonitor():
+  def __init__(self, monitor, hop, window=None, initial_capacity=64):
+    self.monitor = monitor
+    self.hop = hop
+    # the model was trained on at most max_time steps, so that is the natural window
+    self.window = window or monitor.model_info["max_time"]
+    # buffers hold every channel the metadata model consumes (green, red, IR, acc_x/y/z)
+    self.channel_names = list(monitor.signal_feature_names)
+
+    self.soldier_IDs = []
+    self.rows = {}  # soldier_ID -> row in the buffers below
+    self.buffers = np.zeros((initial_capacity, len(self.channel_names), self.window), dtype=np.float32)
+    self.write_pos = np.zeros(initial_capacity, dtype=np.int64)  # next slot to write per soldier
+    self.filled = np.zeros(initial_capacity, dtype=np.int64)  # valid samples per soldier (<= window)
+    self.pending = np.zeros(initial_capacity, dtype=np.int64)  # samples since last emission
+
+    # most recent emitted results per soldier
+    self.latest_metadata = {}
+    self.latest_predictions = {}
+
+  def _row(self, soldier_ID):
+    row = self.rows.get(soldier_ID)
+    if row is not None:
+      return row
+    row = len(self.soldier_IDs)
+    if row == self.buffers.shape[0]:
+      # grow all per-soldier arrays geometrically
+      grow = max(row, 1)
+      self.buffers = np.concatenate([self.buffers, np.zeros((grow,) + self.buffers.shape[1:], dtype=self.buffers.dtype)])
+      self.write_pos = np.concatenate([self.write_pos, np.zeros(grow, dtype=np.int64)])
+      self.filled = np.concatenate([self.filled, np.zeros(grow, dtype=np.int64)])
+      self.pending = np.concatenate([self.pending, np.zeros(grow, dtype=np.int64)])
+    self.rows[soldier_ID] = row
+    self.soldier_IDs.append(soldier_ID)
+    return row
+
+  def push(self, soldier_ID, chunk):
+    # chunk: (num_features, n) array in signal_feature_names order, or {channel name: 1-D array}
+    if isinstance(chunk, dict):
+      chunk = np.stack([np.asarray(chunk[name], dtype=np.float32) for name in self.channel_names])
+    chunk = np.asarray(chunk, dtype=np.float32)
+    n = chunk.shape[1]
+    if n == 0:
+      return
+    row = self._row(soldier_ID)
+    self.pending[row] += n
+    self.filled[row] = min(self.filled[row] + n, self.window)
+    if n >= self.window:
+      # only the newest window survives
+      self.buffers[row] = chunk[:, -self.window:]
+      self.write_pos[row] = 0
+      return
+    start = self.write_pos[row]
+    first = min(n, self.window - start)
+    self.buffers[row, :, start:start + first] = chunk[:, :first]
+    self.buffers[row, :, :n - first] = chunk[:, first:]
+    self.write_pos[row] = (start + n) % self.window
+
+  def push_many(self, chunks):
+    for soldier_ID, chunk in chunks.items():
+      self.push(soldier_ID, chunk)
+
+  def window_for(self, soldier_ID):
+    # chronologically ordered copy of a soldier's current window
+    row = self.rows[soldier_ID]
+    filled = self.filled[row]
+    idx = (self.write_pos[row] - filled + np.arange(filled)) % self.window
+    return self.buffers[row][:, idx]
+
+  def changed(self):
+    num_soldiers = len(self.soldier_IDs)
+    rows = np.nonzero(self.pending[:num_soldiers] >= self.hop)[0]
+    return [self.soldier_IDs[row] for row in rows]
+
+  def step(self):
+    # re-emit metadata and health predictions for soldiers whose window moved by >= hop samples
+    changed_IDs = self.changed()
+    if not changed_IDs:
+      return None, {}
+    windows = [self.window_for(ID) for ID in changed_IDs]
+    metadata = self.monitor.generate_metadata(windows, changed_IDs)
+    predictions = self.monitor.generate_health_predictions(metadata.values, changed_IDs)
+    for ID in changed_IDs:
+      self.pending[self.rows[ID]] = 0
+      self.latest_metadata[ID] = metadata.loc[ID]
+      self.latest_predictions[ID] = predictions[ID]
+    return metadata, predictions
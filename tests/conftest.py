@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the modules live flat in the repository root and in Subject-monitoring/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "Subject-monitoring")):
+  if path not in sys.path:
+    sys.path.insert(0, path)
@@ -0,0 +1,86 @@
+import datetime
+
+from backfill_cache import BackfillCache
+
+class StubResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def get_json(self):
+        return self.payload
+
+class StubTerra:
+    # one activity record per hour that has already happened on the stub clock
+    def __init__(self, clock):
+        self.clock = clock
+        self.requests = []
+
+    def from_user_id(self, user_id):
+        return self
+
+    def get_activity(self, start_date, end_date, to_webhook=True):
+        self.requests.append((start_date, end_date))
+        hours = []
+        hour = start_date
+        while hour < min(end_date, self.clock.now):
+            hours.append({"metadata": {"start_time": hour.isoformat()}})
+            hour += datetime.timedelta(hours=1)
+        return StubResponse({"data": hours})
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def records_on(response, day):
+    return [r for r in response["data"] if r["metadata"]["start_time"].startswith(day)]
+
+def test_day_fetched_while_current_is_fetched_again(tmp_path):
+    clock = Clock(datetime.datetime(2026, 10, 10, 15, 30))
+    terra = StubTerra(clock)
+    cache = BackfillCache(terra, str(tmp_path), now=clock)
+    day = datetime.datetime(2026, 10, 10)
+
+    assert len(records_on(cache.get_activity("user", day, day), "2026-10-10")) == 16
+
+    clock.now = datetime.datetime(2026, 10, 11, 12, 0)
+    assert len(records_on(cache.get_activity("user", day, day), "2026-10-10")) == 24
+    assert len(terra.requests) == 2
+
+    # fetched after the day settled: served from cache from now on, also after a restart
+    clock.now = datetime.datetime(2026, 10, 12, 12, 0)
+    restarted = BackfillCache(terra, str(tmp_path), now=clock)
+    assert len(records_on(restarted.get_activity("user", day, day), "2026-10-10")) == 24
+    assert len(terra.requests) == 2
+
+def test_day_fetched_before_settling_is_fetched_again(tmp_path):
+    # fetched just after midnight, before late syncs are in: not final yet
+    clock = Clock(datetime.datetime(2026, 10, 11, 1, 0))
+    terra = StubTerra(clock)
+    cache = BackfillCache(terra, str(tmp_path), settle=datetime.timedelta(hours=6), now=clock)
+    day = datetime.datetime(2026, 10, 10)
+    cache.get_activity("user", day, day)
+
+    clock.now = datetime.datetime(2026, 10, 11, 8, 0)
+    cache.get_activity("user", day, day)
+    cache.get_activity("user", day, day)
+    assert len(terra.requests) == 2
+
+def test_leftover_files_are_ignored_on_start(tmp_path):
+    clock = Clock(datetime.datetime(2026, 10, 12, 12, 0))
+    terra = StubTerra(clock)
+    cache = BackfillCache(terra, str(tmp_path), now=clock)
+    day = datetime.datetime(2026, 10, 10)
+    cache.get_activity("user", day, day)
+
+    # an interrupted _put leaves its temporary file behind
+    user_dir = tmp_path / "user"
+    (user_dir / "2026-10-11.json.tmp").write_text('{"fetched_at": ')
+    (user_dir / "notes.txt").write_text("")
+
+    restarted = BackfillCache(terra, str(tmp_path), now=clock)
+    assert sorted(p.name for p in user_dir.iterdir()) == ["2026-10-10.json"]
+    assert len(records_on(restarted.get_activity("user", day, day), "2026-10-10")) == 24
+    assert len(terra.requests) == 1
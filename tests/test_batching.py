@@ -0,0 +1,18 @@
+import numpy as np
+
+from batching import pad_sequences, padding_mask
+
+def test_pad_sequences_keeps_newest_samples_of_long_sequences():
+  short = np.arange(6, dtype=np.float32).reshape(2, 3)
+  long = np.arange(20, dtype=np.float32).reshape(2, 10)
+  padded, lengths = pad_sequences([short, long], max_time=4)
+  np.testing.assert_array_equal(lengths, [3, 4])
+  np.testing.assert_array_equal(padded[0], [[0, 1, 2, 0], [3, 4, 5, 0]])
+  np.testing.assert_array_equal(padded[1], long[:, -4:])
+  np.testing.assert_array_equal(padding_mask(lengths, 4), [[False, False, False, True], [False] * 4])
+
+def test_pad_sequences_long_channel_lists():
+  channels = [np.arange(10, dtype=np.float32), np.arange(10, 20, dtype=np.float32)]
+  padded, lengths = pad_sequences([channels], max_time=3, channels=[1])
+  np.testing.assert_array_equal(lengths, [3])
+  np.testing.assert_array_equal(padded[0, 0], [17, 18, 19])
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from batching import pad_sequences
+from heart_metrics import detect_peaks, hrv_metrics
+
+find_peaks = pytest.importorskip("scipy.signal").find_peaks
+
+def quantized_ppg(rng, num_soldiers, scale, sample_rate=25):
+  # integer ADC counts, so flat-topped beats are common
+  signals = []
+  for n in rng.integers(3, 600, size=num_soldiers):
+    t = np.arange(n) / sample_rate
+    green = np.sin(2 * np.pi * rng.uniform(0.9, 1.6) * t) + 0.1 * rng.standard_normal(n)
+    signals.append(np.round(scale * green)[None, :])
+  return signals
+
+@pytest.mark.parametrize("scale", [1, 3, 20, 100])
+def test_detect_peaks_matches_find_peaks_on_quantized_input(scale):
+  signals = quantized_ppg(np.random.default_rng(scale), 100, scale)
+  padded, lengths = pad_sequences(signals, channels=[0])
+  rows, peaks = detect_peaks(padded[:, 0], lengths)
+  for i, signal in enumerate(signals):
+    expected, _ = find_peaks(signal[0], height=0)
+    np.testing.assert_array_equal(peaks[rows == i], expected)
+
+@pytest.mark.parametrize("signal", [
+  [0, 2, 2, 1],  # plateau of two: left middle sample
+  [0, 3, 3, 3, 1, 0],  # plateau of three: middle sample
+  [0, 2, 2, 2],  # plateau running into the end of the recording
+  [2, 2, 1, 0],  # plateau at the start of the recording
+  [0, 1, 1, 2, 0],  # step up, not a peak
+  [1, 1, 1],
+])
+def test_detect_peaks_plateaus(signal):
+  signal = np.asarray(signal, dtype=float)
+  rows, peaks = detect_peaks(signal[None, :], [len(signal)])
+  np.testing.assert_array_equal(peaks, find_peaks(signal, height=0)[0])
+
+def test_hrv_metrics_heart_rate_on_quantized_input():
+  sample_rate = 25
+  signals = quantized_ppg(np.random.default_rng(0), 50, 1, sample_rate)
+  padded, lengths = pad_sequences(signals, channels=[0])
+  metrics = hrv_metrics(padded[:, 0], lengths, sample_rate)
+  for i, signal in enumerate(signals):
+    rr = np.diff(find_peaks(signal[0], height=0)[0]) / sample_rate
+    expected = 60.0 / rr.mean() if len(rr) else np.nan
+    np.testing.assert_allclose(metrics["heart_rate"][i], expected)
@@ -0,0 +1,27 @@
+import random
+import threading
+import time
+
+from ingest import WebhookIngestor
+
+def test_payloads_of_one_user_are_handled_in_order():
+    handled = {}
+    lock = threading.Lock()
+
+    def handle_batch(batch):
+        time.sleep(random.uniform(0, 0.002))
+        with lock:
+            for body in batch:
+                handled.setdefault(body["user"]["user_id"], []).append(body["seq"])
+
+    ingestor = WebhookIngestor(handle_batch, num_workers=4, batch_size=3, batch_wait=0.001)
+    ingestor.start()
+    users = [f"user-{i}" for i in range(6)]
+    for seq in range(300):
+        assert ingestor.submit({"user": {"user_id": users[seq % len(users)]}, "seq": seq})
+    ingestor.stop()
+
+    assert sorted(handled) == users
+    for user, seqs in handled.items():
+        assert seqs == sorted(seqs)
+        assert len(seqs) == 50
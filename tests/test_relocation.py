@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from relocation import plan_relocation
+from spatial_index import SpatialIndex
+
+pytest.importorskip("scipy")
+
+def random_graph(rng, num_people=60, grid=6):
+  return {f"p{i}": {"location": [int(v) for v in rng.integers(0, grid, size=2)], "health": float(rng.uniform())}
+          for i in range(num_people)}
+
+@pytest.mark.parametrize("seed", range(20))
+def test_index_and_scan_agree_with_repeated_targets(seed):
+  rng = np.random.default_rng(seed)
+  graph_data = random_graph(rng)
+  locations = sorted({tuple(d["location"]) for d in graph_data.values()})
+  picked = [locations[i] for i in rng.choice(len(locations), size=3, replace=False)]
+  targets = picked + [picked[0], picked[1]]
+  threshold = 0.6
+
+  plan, cost = plan_relocation(graph_data, targets, threshold)
+  indexed_plan, indexed_cost = plan_relocation(graph_data, targets, threshold, index=SpatialIndex(graph_data))
+  unique_plan, unique_cost = plan_relocation(graph_data, picked, threshold)
+
+  assert indexed_cost == pytest.approx(cost)
+  assert cost == pytest.approx(unique_cost)
+  for p in (plan, indexed_plan):
+    replaced = [a for a, _ in p]
+    assert len(replaced) == len(set(replaced))
+    assert len(p) == len(unique_plan)
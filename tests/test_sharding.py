@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sklearn")
+
+import benchmark
+
+@pytest.fixture(scope="module")
+def squad():
+  squad = benchmark.make_squad(40, max_time=120)
+  # benchmark.make_model's class is local to the function, so it can never be pickled
+  return squad, benchmark.make_monitor(squad)
+
+def assert_same_results(monitor, results, signals, soldier_IDs):
+  expected_heart = monitor.generate_heart_metrics(signals, soldier_IDs)
+  np.testing.assert_allclose(results["heart"].values, expected_heart.values)
+  assert list(results["heart"].index) == list(soldier_IDs)
+  assert results["movement"] == monitor.generate_movement_data(signals, soldier_IDs)
+  expected_health = monitor.end_to_end(signals, soldier_IDs)
+  assert list(results["health"]) == list(soldier_IDs)
+  for ID in soldier_IDs:
+    assert results["health"][ID][0] == expected_health[ID][0]
+    assert results["health"][ID][1] == pytest.approx(expected_health[ID][1])
+
+@pytest.mark.parametrize("start_method", [None, "spawn"])
+def test_sharded_run_matches_single_process(squad, start_method):
+  squad, monitor = squad
+  signals, soldier_IDs = squad["signals"], squad["soldier_IDs"]
+  runner = monitor.sharded(2, shard_size=7, start_method=start_method)
+  try:
+    results = runner.run(signals, soldier_IDs)
+  finally:
+    runner.close()
+  assert_same_results(monitor, results, signals, soldier_IDs)
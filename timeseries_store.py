@@ -0,0 +1,126 @@
+import os
+import threading
+import time
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+# Append-only columnar store for wearable samples.
+# Layout on disk:
+#   <root>/<soldier>/<channel>/<chunk>.bin   fixed-dtype samples, chunk_samples per file
+#   <root>/<soldier>/<channel>/index.bin     (first sample offset, timestamp ns) per append
+# Channels are independent, so slow channels (bpm) and raw 25 Hz channels (green, acc_x/y/z)
+# can live side by side. Reads inside a single chunk are zero-copy np.memmap views.
+
+INDEX_DTYPE = np.dtype([("offset", "<i8"), ("timestamp", "<i8")])
+
+
+class SampleStore():
+  def __init__(self, root, dtype=np.float32, chunk_samples=1 << 16):
+    self.root = root
+    self.dtype = np.dtype(dtype)
+    self.chunk_samples = chunk_samples
+    self.lock = threading.Lock()
+    self.lengths = {}  # (soldier, channel) -> number of samples
+    os.makedirs(root, exist_ok=True)
+
+  def _dir(self, soldier, channel):
+    return os.path.join(self.root, quote(str(soldier), safe=""), quote(channel, safe=""))
+
+  def _chunk_path(self, soldier, channel, chunk):
+    return os.path.join(self._dir(soldier, channel), f"{chunk:06d}.bin")
+
+  def soldiers(self):
+    return sorted(unquote(name) for name in os.listdir(self.root))
+
+  def channels(self, soldier):
+    path = os.path.join(self.root, quote(str(soldier), safe=""))
+    return sorted(unquote(name) for name in os.listdir(path)) if os.path.isdir(path) else []
+
+  def length(self, soldier, channel):
+    key = (soldier, channel)
+    if key not in self.lengths:
+      directory = self._dir(soldier, channel)
+      chunks = sorted(name for name in os.listdir(directory) if name != "index.bin") if os.path.isdir(directory) else []
+      length = 0
+      if chunks:
+        last = os.path.getsize(os.path.join(directory, chunks[-1])) // self.dtype.itemsize
+        length = (len(chunks) - 1) * self.chunk_samples + last
+      self.lengths[key] = length
+    return self.lengths[key]
+
+  def append(self, soldier, channels, timestamp=None):
+    # channels: {channel name: 1-D array}; timestamp (ns since epoch) of the first sample
+    timestamp = time.time_ns() if timestamp is None else int(timestamp)
+    with self.lock:
+      for channel, values in channels.items():
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        if len(values) == 0:
+          continue
+        os.makedirs(self._dir(soldier, channel), exist_ok=True)
+        offset = self.length(soldier, channel)
+        with open(os.path.join(self._dir(soldier, channel), "index.bin"), "ab") as f:
+          f.write(np.array([(offset, timestamp)], dtype=INDEX_DTYPE).tobytes())
+        written = 0
+        while written < len(values):
+          position = offset + written
+          chunk, within = divmod(position, self.chunk_samples)
+          n = min(self.chunk_samples - within, len(values) - written)
+          with open(self._chunk_path(soldier, channel, chunk), "ab") as f:
+            f.write(values[written:written + n].tobytes())
+          written += n
+        self.lengths[(soldier, channel)] = offset + len(values)
+
+  def read(self, soldier, channel, start=0, stop=None):
+    # samples [start, stop) of one channel; a view into the chunk file when it fits in one chunk
+    length = self.length(soldier, channel)
+    stop = length if stop is None else min(stop, length)
+    start = max(0, min(start, stop))
+    pieces = []
+    position = start
+    while position < stop:
+      chunk, within = divmod(position, self.chunk_samples)
+      n = min(self.chunk_samples - within, stop - position)
+      pieces.append(np.memmap(self._chunk_path(soldier, channel, chunk), dtype=self.dtype, mode="r",
+                              offset=within * self.dtype.itemsize, shape=(n,)))
+      position += n
+    if not pieces:
+      return np.zeros(0, dtype=self.dtype)
+    return pieces[0] if len(pieces) == 1 else np.concatenate(pieces)
+
+  def read_window(self, soldier, channels, start=None, stop=None, last=None):
+    # aligned window over several channels as a list of 1-D arrays (one per channel), ready for
+    # SquadMonitor; `last` reads the newest `last` samples
+    length = min(self.length(soldier, channel) for channel in channels)
+    if last is not None:
+      start, stop = max(0, length - last), length
+    start = 0 if start is None else start
+    stop = length if stop is None else min(stop, length)
+    return [self.read(soldier, channel, start, stop) for channel in channels]
+
+  def index(self, soldier, channel):
+    path = os.path.join(self._dir(soldier, channel), "index.bin")
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+      return np.zeros(0, dtype=INDEX_DTYPE)
+    return np.memmap(path, dtype=INDEX_DTYPE, mode="r")
+
+  def time_range(self, soldier, channel, start_time, end_time):
+    # sample range covering the appends whose first-sample timestamp is in [start_time, end_time).
+    # Timestamps are measurement times, so a delayed or backfilled append can be older than the one
+    # before it; the range then spans from the first to the last matching append
+    index = self.index(soldier, channel)
+    if len(index) == 0:
+      return 0, 0
+    timestamps = index["timestamp"]
+    if np.any(timestamps[1:] < timestamps[:-1]):
+      selected = np.flatnonzero((timestamps >= start_time) & (timestamps < end_time))
+      if len(selected) == 0:
+        return 0, 0
+      ends = np.append(index["offset"][1:], self.length(soldier, channel))
+      return int(index["offset"][selected].min()), int(ends[selected].max())
+    first = np.searchsorted(index["timestamp"], start_time, side="left")
+    last = np.searchsorted(index["timestamp"], end_time, side="left")
+    length = self.length(soldier, channel)
+    start = int(index["offset"][first]) if first < len(index) else length
+    stop = int(index["offset"][last]) if last < len(index) else length
+    return start, stop